@@ -1,256 +1,421 @@
-import streamlit as st
-import aiohttp
-import asyncio
+import concurrent.futures
+import time
 from datetime import datetime
-from typing import Dict, List, Tuple
-from openai import OpenAI
-from prompts import main_pubmed_prompt, clinical_trials_prompt, review_type_prompt
-import xml.etree.ElementTree as ET
-
-# Function to create chat completion
-@st.cache_data
-def create_chat_completion(
-    messages,
-    model="gpt-4o",
-    frequency_penalty=0,
-    logit_bias=None,
-    logprobs=False,
-    top_logprobs=None,
-    max_tokens=None,
-    n=1,
-    presence_penalty=0,
-    response_format=None,
-    seed=42,  # Adding seed for reproducibility
-    stop=None,
-    stream=False,
-    include_usage=False,
-    temperature=1,
-    top_p=1,
-    tools=None,
-    tool_choice="none",
-    user=None
-):
-    client = OpenAI()
-
-    params = {
-        "model": model,
-        "messages": messages,
-        "frequency_penalty": frequency_penalty,
-        "logit_bias": logit_bias,
-        "logprobs": logprobs,
-        "top_logprobs": top_logprobs,
-        "max_tokens": max_tokens,
-        "n": n,
-        "presence_penalty": presence_penalty,
-        "response_format": response_format,
-        "seed": seed,
-        "stop": stop,
-        "stream": stream,
-        "temperature": temperature,
-        "top_p": top_p,
-        "user": user
-    }
-
-    if stream:
-        params["stream_options"] = {"include_usage": include_usage}
-    else:
-        params.pop("stream_options", None)
-
-    if tools:
-        params["tools"] = [{"type": "function", "function": tool} for tool in tools]
-        params["tool_choice"] = tool_choice
-
-    if response_format == "json_object":
-        params["response_format"] = {"type": "json_object"}
-    elif response_format == "text":
-        params["response_format"] = {"type": "text"}
-    else:
-        params.pop("response_format", None)
-
-    params = {k: v for k, v in params.items() if v is not None}
-    
-    completion = client.chat.completions.create(**params)
-    
-    return completion
-
-# Function to fetch article details with retry logic
-async def fetch_article_details(session: aiohttp.ClientSession, id: str, details_url: str, abstracts_url: str, semaphore: asyncio.Semaphore) -> Tuple[str, Dict, str]:
-    async with semaphore:
-        for attempt in range(3):  # Retry up to 3 times for rate limit errors
-            try:
-                async with session.get(details_url) as details_response:
-                    details_response.raise_for_status()
-                    details_data = await details_response.json()
-                
-                async with session.get(abstracts_url) as abstracts_response:
-                    abstracts_response.raise_for_status()
-                    abstracts_data = await abstracts_response.text()
-                
-                if details_data and 'result' in details_data:
-                    return id, details_data, abstracts_data
-                else:
-                    st.error(f"No details found for ID {id}, attempt {attempt + 1}")
+import altair as alt
+import pandas as pd
+import streamlit as st
+from typing import AsyncIterator, Coroutine, Dict, Iterator, List, Optional, Tuple
+from article_cache import ArticleCache
+from background_loop import BackgroundLoop, BufferedStream
+from rate_limiter import RateLimiter
+from query_cache import QueryCache
+from rerank import BM25Index, rerank_articles
+from result_store import ResultStore
+from facets import FacetIndex
+from saved_searches import SavedSearchStore, refresh_all, refresh_saved_search
+from metrics import Trace, record_span, search_trace, serve_metrics, span, traced
+from summary_cache import SummaryCache
+from summarize import summarize_articles
+from pubmed_search import (SEARCH_STRATEGIES, configure, get_query_cache, multi_strategy_search,
+                           optimize_query_stream, pubmed_abstracts, pubmed_abstracts_stream, search_client, search_notices)
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+RERANK_CANDIDATES = 200  # ESearch results fetched when re-ranking locally against the question
+RERANK_BUDGET_SECONDS = 0.5
+RESULTS_PAGE_SIZE = 10
+FACET_OPTIONS = 30  # Most common values offered per facet
+FACET_LABELS = {'publication_types': 'Publication type', 'mesh_terms': 'MeSH term', 'journal': 'Journal'}
+ALL_STRATEGIES = 'all strategies at once'
+SUMMARY_MAX_ARTICLES = 50  # Results beyond this are left out of a summary to bound its cost
+
+# Function to configure the search pipeline's shared caches, rate limiter and API key from secrets, once per process
+@st.cache_resource
+def configure_search() -> None:
+    # Lexical MinHash similarity; keep the threshold high so "primary" vs "secondary prevention" never collide
+    threshold = st.secrets.get("query_similarity_threshold", 0.9)
+    configure(
+        pubmed_api_key=st.secrets['pubmed_api_key'],
+        article_cache=ArticleCache(
+            path=st.secrets.get("article_cache_path", "article_cache.sqlite3"),
+            ttl_seconds=float(st.secrets.get("article_cache_ttl_hours", 24 * 7)) * 3600,
+            max_entries=int(st.secrets.get("article_cache_max_entries", 50000)),
+            search_ttl_seconds=float(st.secrets.get("search_cache_ttl_minutes", 60)) * 60,
+        ),
+        query_cache=QueryCache(
+            path=st.secrets.get("query_cache_path", "query_cache.sqlite3"),
+            ttl_seconds=float(st.secrets.get("query_cache_ttl_days", 30)) * 24 * 3600,
+            max_entries=int(st.secrets.get("query_cache_max_entries", 10000)),
+            similarity_threshold=float(threshold) if threshold else None,
+        ),
+        # NCBI allows 10 requests/second with an API key; this limiter only serves the background loop
+        rate_limiter=RateLimiter(rate=float(st.secrets.get("ncbi_requests_per_second", 10))),
+        summary_cache=SummaryCache(
+            path=st.secrets.get("summary_cache_path", "summary_cache.sqlite3"),
+            ttl_seconds=float(st.secrets.get("summary_cache_ttl_days", 30)) * 24 * 3600,
+            max_entries=int(st.secrets.get("summary_cache_max_entries", 50000)),
+        ),
+    )
+
+
+# Function to get the event loop and pooled HTTP session shared by every session
+@st.cache_resource
+def get_background_loop() -> BackgroundLoop:
+    return BackgroundLoop(
+        limit=int(st.secrets.get("http_pool_size", 100)),
+        limit_per_host=int(st.secrets.get("http_pool_size_per_host", 10)),
+    )
+
+
+# Function to serve Prometheus metrics from the background loop when a metrics_port secret is set, once per process
+@st.cache_resource
+def start_metrics_server() -> None:
+    port = st.secrets.get("metrics_port")
+    if port:
+        get_background_loop().run(serve_metrics(int(port)))
+
+
+# Function to get the article store shared by every session, which keeps only PMID lists in session state
+@st.cache_resource
+def get_result_store() -> ResultStore:
+    return ResultStore(max_entries=int(st.secrets.get("result_store_max_entries", 20000)))
+
+
+# Function to get the watched searches, shared by every session
+@st.cache_resource
+def get_saved_searches() -> SavedSearchStore:
+    return SavedSearchStore(path=st.secrets.get("saved_searches_path", "saved_searches.sqlite3"))
+
+
+# Function to save a search's articles to the shared store and keep only their PMIDs in this session
+def save_results(articles: List[Dict]) -> None:
+    st.session_state.result_pmids = get_result_store().put_many(articles)
+    st.session_state.result_strategies = {article['pmid']: article['strategies'] for article in articles if article.get('strategies')}
+    st.session_state.summary = None
+
+
+# Function to show a page selector when results span several pages and return the slice for the chosen page
+def page_slice(total: int, key: str) -> slice:
+    pages = (total + RESULTS_PAGE_SIZE - 1) // RESULTS_PAGE_SIZE
+    page = 1
+    if pages > 1:
+        page = st.number_input(f'Page (of {pages}):', min_value=1, max_value=pages, value=1, key=f"{key}_results_page")
+    return slice((page - 1) * RESULTS_PAGE_SIZE, page * RESULTS_PAGE_SIZE)
+
+
+# Function to offer facet filters over this session's results and return the PMIDs that pass them, without any requests
+def narrow_results(pmids: List[str], key: str) -> List[str]:
+    cached = st.session_state.result_facets
+    if cached is None or cached[0] != pmids:
+        cached = (pmids, FacetIndex(get_result_store().get_many(pmids)))
+        st.session_state.result_facets = cached
+    facets = cached[1]
+
+    with st.expander("Narrow these results"):
+        selected = {}
+        for facet, label in FACET_LABELS.items():
+            counts = facets.counts(facet, top=FACET_OPTIONS)
+            if len(counts) > 1:
+                selected[facet] = st.multiselect(f'{label}:', counts.index.tolist(), format_func=lambda value, counts=counts: f"{value} ({counts[value]})",
+                                                 key=f"{key}_{facet}")
+        years = facets.year_range()
+        if years and years[0] < years[1]:
+            years = st.slider('Publication years:', years[0], years[1], years, key=f"{key}_facet_years")
+        mask = facets.mask(selected, years)
+        st.bar_chart(facets.year_histogram(mask))
+        st.caption(f"{int(mask.sum())} of {len(facets)} results match")
+    return facets.pmids[mask].tolist()
+
+
+# Function to render one page of this session's results, converting only that page's articles
+def render_results_page(key: str, trace: Optional[Trace] = None) -> None:
+    pmids = st.session_state.result_pmids
+    if len(pmids) > 1:
+        pmids = narrow_results(pmids, key)
+    page_pmids = pmids[page_slice(len(pmids), key)]
+    with traced(trace), span("render", articles=len(page_pmids)):
+        articles = get_result_store().get_many(page_pmids)
+        for article in articles:
+            if article['pmid'] in st.session_state.result_strategies:
+                article['strategies'] = st.session_state.result_strategies[article['pmid']]
+            render_article(article)
+    if len(articles) < len(page_pmids):
+        st.info("Some results have expired from memory; search again to see them.")
+    summary_section(pmids, key)
+
+
+# Function to offer an answer to the question synthesized from the shown results, citing them by number
+def summary_section(pmids: List[str], key: str) -> None:
+    question = st.session_state.original_query
+    if not (question and pmids):
+        return
+    pmids = pmids[:SUMMARY_MAX_ARTICLES]
+    summarize = st.button("Summarize these results", key=f"{key}_summarize",
+                          help=f"Answer your question from the abstracts of the first {SUMMARY_MAX_ARTICLES} results shown, citing them")
+    summary = st.session_state.summary
+    if not summarize and not (summary and summary["pmids"] == pmids):
+        return
+    with st.container(border=True):
+        answer_placeholder = st.empty()
+        if summarize:
+            articles = get_result_store().get_many(pmids)
+            answer_placeholder.caption(f"Summarizing {len(articles)} abstracts...")
+            stats = {}
+            answer = ""
+            trace = st.session_state.last_trace
+            for answer in stream_in_background(summarize_articles(question, articles, stats), trace=trace):
+                answer_placeholder.markdown(answer)
+            summary = {"pmids": pmids, "references": [(article['title'], article['link']) for article in articles], "answer": answer, "stats": stats}
+            st.session_state.summary = summary
+        else:
+            answer_placeholder.markdown(summary["answer"])
+        for i, (title, link) in enumerate(summary["references"], start=1):
+            st.caption(f"[{i}] [{title}]({link})")
+        stats = summary["stats"]
+        if "total_seconds" in stats:
+            st.caption(f"{stats['map_requests']} summary requests · {stats['cached_summaries']} summaries cached · "
+                       f"{stats.get('prompt_tokens', 0)} prompt + {stats.get('completion_tokens', 0)} completion tokens · "
+                       f"${stats.get('cost_usd', 0):.4f} · first token {stats.get('first_token_seconds', 0):.1f}s · total {stats['total_seconds']:.1f}s")
+
+
+# Function to run a coroutine on the shared loop and show any messages it reported on this page
+def run_in_background(coro: Coroutine, trace: Optional[Trace] = None):
+    notices = []
+    try:
+        return submit_in_background(coro, notices, trace).result()
+    finally:
+        for level, message in notices:
+            getattr(st, level)(message)
 
-            except aiohttp.ClientResponseError as e:
-                if e.status == 429:  # Handle rate limit error
-                    await asyncio.sleep(2 ** attempt)  # Exponential backoff
-                else:
-                    st.error(f"ClientResponseError for ID {id}: {e}")
-                    raise
-            except Exception as e:
-                if attempt == 2:
-                    st.error(f"Error fetching details for ID {id}: {e}")
-                    return id, {}, ''
-                else:
-                    await asyncio.sleep(2 ** attempt)  # Exponential backoff on general errors
 
-    return id, {}, ''
+# Function to start a coroutine on the shared loop for this session without waiting; its messages collect in notices
+def submit_in_background(coro: Coroutine, notices: List[Tuple[str, str]], trace: Optional[Trace] = None) -> concurrent.futures.Future:
+    ctx = get_script_run_ctx()
+    client = ctx.session_id if ctx else "default"
 
+    async def run_with_notices():
+        search_notices.set(notices)
+        search_client.set(client)
+        search_trace.set(trace)
+        return await coro
 
-# Function to extract abstract from XML
-async def extract_abstract_from_xml(xml_data: str, pmid: str) -> str:
-    try:
-        root = ET.fromstring(xml_data)
-        for article in root.findall(".//PubmedArticle"):
-            medline_citation = article.find("MedlineCitation")
-            if medline_citation:
-                pmid_element = medline_citation.find("PMID")
-                if pmid_element is not None and pmid_element.text == pmid:
-                    abstract_element = medline_citation.find(".//Abstract")
-                    if abstract_element is not None:
-                        abstract_texts = []
-                        for elem in abstract_element.findall("AbstractText"):
-                            label = elem.get("Label")
-                            text = ET.tostring(elem, encoding='unicode', method='text').strip()
-                            if label:
-                                abstract_texts.append(f"{label}: {text}")
-                            else:
-                                abstract_texts.append(text)
-                        return " ".join(abstract_texts).strip()
-        return "No abstract available"
-    except ET.ParseError as e:
-        st.error(f"Error parsing XML for PMID {pmid}: {e}")
-        return "Error extracting abstract"
-
-
-# Function to fetch additional results
-async def fetch_additional_results(session: aiohttp.ClientSession, search_query: str, max_results: int, current_count: int) -> List[str]:
-    additional_needed = max_results - current_count
-    url = f"https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi?db=pubmed&term={search_query}&sort=relevance&retmode=json&retmax={additional_needed}&api_key={st.secrets['pubmed_api_key']}"
-    
+    return get_background_loop().submit(run_with_notices())
+
+
+# Function to iterate an async generator on the shared loop, yielding its items on this page as they arrive
+def stream_in_background(agen: AsyncIterator, trace: Optional[Trace] = None) -> Iterator:
+    notices = []
     try:
-        async with session.get(url) as response:
-            response.raise_for_status()
-            data = await response.json()
-            return data['esearchresult'].get('idlist', [])
-    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
-        print(f"Error fetching additional results: {e}")
-        return []
-
-# Function to fetch PubMed abstracts
-async def pubmed_abstracts(search_terms: str, search_type: str = "all", max_results: int = 5, years_back: int = 3, human_only: bool = False) -> Tuple[List[Dict[str, str]], List[str]]:
-    current_year = datetime.now().year
-    start_year = current_year - years_back
-    human_filter = "+AND+humans[MeSH+Terms]" if human_only else ""
-    search_query = f"{search_terms}+AND+{start_year}[PDAT]:{current_year}[PDAT]{human_filter}"
-    url = f"https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi?db=pubmed&term={search_query}&sort=relevance&retmode=json&retmax={max_results}&api_key={st.secrets['pubmed_api_key']}"
-
-    async with aiohttp.ClientSession() as session:
+        yield from start_stream_in_background(agen, notices, trace)
+    finally:
+        for level, message in notices:
+            getattr(st, level)(message)
+
+
+# Function to start an async generator on the shared loop for this session, buffering its items until they are iterated
+def start_stream_in_background(agen: AsyncIterator, notices: List[Tuple[str, str]], trace: Optional[Trace] = None) -> BufferedStream:
+    ctx = get_script_run_ctx()
+    client = ctx.session_id if ctx else "default"
+
+    async def stream_with_notices():
+        search_notices.set(notices)
+        search_client.set(client)
+        search_trace.set(trace)
+        async for item in agen:
+            yield item
+
+    return get_background_loop().start_stream(stream_with_notices())
+
+
+# Function to start fetching the results for a search key in the background, cancelling a prefetch for any other key
+def prefetch_search(key: Tuple[str, str, int, int, bool]) -> None:
+    prefetch = st.session_state.prefetch
+    if prefetch and prefetch["key"] == key:
+        return
+    cancel_prefetch()
+    query, search_type, max_results, years_back, human_only = key
+    notices = []
+    trace = Trace()
+    # Streamed like a search, so clicking Search mid-prefetch shows the articles already in and then the rest as they arrive
+    search = pubmed_abstracts_stream(query, search_type, max_results, years_back, human_only, session=get_background_loop().session)
+    stream = start_stream_in_background(search, notices, trace)
+    st.session_state.prefetch = {"key": key, "stream": stream, "notices": notices, "trace": trace, "used": False}
+
+
+# Function to cancel this session's prefetch, if one is running
+def cancel_prefetch() -> None:
+    if st.session_state.prefetch:
+        st.session_state.prefetch["stream"].cancel()
+        st.session_state.prefetch = None
+
+
+# Function to take the prefetched ((rank, article) iterator, trace) for a search key; None if there is none
+def take_prefetch(key: Tuple[str, str, int, int, bool]) -> Optional[Tuple[Iterator[Tuple[int, Dict]], Trace]]:
+    prefetch = st.session_state.prefetch
+    # A prefetch is used once; searching again goes to NCBI, where the article cache answers repeats
+    if not prefetch or prefetch["key"] != key or prefetch["used"] or prefetch["stream"].future.cancelled():
+        return None
+    prefetch["used"] = True
+
+    def prefetched_articles() -> Iterator[Tuple[int, Dict]]:
         try:
-            async with session.get(url) as response:
-                response.raise_for_status()
-                data = await response.json()
-                if 'esearchresult' not in data or 'count' not in data['esearchresult']:
-                    st.error("Unexpected response format from PubMed API")
-                    return [], []
-                if int(data['esearchresult']['count']) == 0:
-                    st.write("No PubMed results found within the time period. Expand time range in settings or try a different question.")
-                    return [], []
-
-            ids = data['esearchresult'].get('idlist', [])
-            if not ids:
-                st.write("No results found.")
-                return [], []
-
-            articles = []
-            unique_urls = set()
-            semaphore = asyncio.Semaphore(5)
-            tasks = []
-
-            for id in ids:
-                details_url = f"https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esummary.fcgi?db=pubmed&id={id}&retmode=json&api_key={st.secrets['pubmed_api_key']}"
-                abstracts_url = f"https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi?db=pubmed&id={id}&retmode=xml&rettype=abstract&api_key={st.secrets['pubmed_api_key']}"
-                tasks.append(fetch_article_details(session, id, details_url, abstracts_url, semaphore))
-
-            results = await asyncio.gather(*tasks)
-
-            for id, details_data, abstracts_data in results:
-                if details_data and 'result' in details_data and str(id) in details_data['result']:
-                    article = details_data['result'][str(id)]
-                    year = article['pubdate'].split(" ")[0]
-                    if year.isdigit():
-                        abstract = await extract_abstract_from_xml(abstracts_data, id)
-                        article_url = f"https://pubmed.ncbi.nlm.nih.gov/{id}"
-                        if abstract.strip() and abstract != "No abstract available":
-                            articles.append({
-                                'title': article['title'],
-                                'year': year,
-                                'link': article_url,
-                                'abstract': abstract.strip()
-                            })
-                            unique_urls.add(article_url)
-                else:
-                    st.error(f"Details not available for ID {id}. Details data: {details_data}")
-
-            while len(articles) < max_results:
-                additional_ids = await fetch_additional_results(session, search_query, max_results, len(articles))
-                if not additional_ids:
-                    break
-
-                additional_tasks = []
-                for id in additional_ids:
-                    details_url = f"https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esummary.fcgi?db=pubmed&id={id}&retmode=json&api_key={st.secrets['pubmed_api_key']}"
-                    abstracts_url = f"https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi?db=pubmed&id={id}&retmode=xml&rettype=abstract&api_key={st.secrets['pubmed_api_key']}"
-                    additional_tasks.append(fetch_article_details(session, id, details_url, abstracts_url, semaphore))
-
-                additional_results = await asyncio.gather(*additional_tasks)
-
-                for id, details_data, abstracts_data in additional_results:
-                    if details_data and 'result' in details_data and str(id) in details_data['result']:
-                        article = details_data['result'][str(id)]
-                        year = article['pubdate'].split(" ")[0]
-                        if year.isdigit():
-                            abstract = await extract_abstract_from_xml(abstracts_data, id)
-                            article_url = f"https://pubmed.ncbi.nlm.nih.gov/{id}"
-                            if abstract.strip() and abstract != "No abstract available":
-                                articles.append({
-                                    'title': article['title'],
-                                    'year': year,
-                                    'link': article_url,
-                                    'abstract': abstract.strip()
-                                })
-                                unique_urls.add(article_url)
-                                if len(articles) >= max_results:
-                                    break
-
-        except aiohttp.ClientError as e:
-            st.error(f"Error connecting to PubMed API: {e}")
-            return [], []
+            yield from prefetch["stream"]
+        finally:
+            for level, message in prefetch["notices"]:
+                getattr(st, level)(message)
+
+    return prefetched_articles(), prefetch["trace"]
+
+
+# Function to render one article
+def render_article(article: Dict) -> None:
+    st.write(f"### [{article['title']}]({article['link']})")
+    if article.get('new'):
+        st.caption("🆕 New since the last refresh")
+    st.write(f"**Year:** {article['year']}")
+    details = [article.get('journal'), ", ".join(article.get('publication_types') or []), f"doi:{article['doi']}" if article.get('doi') else ""]
+    if any(details):
+        st.caption(" · ".join(detail for detail in details if detail))
+    if article.get('strategies'):
+        st.caption(f"Found by: {', '.join(article['strategies'])}")
+    st.write(f"**Abstract:** {article['abstract']}")
+
+
+# Function to render the search options popover and return (search_type, max_results, years_back, human_only, rerank)
+def search_options(key: str, show_rerank: bool = False) -> Tuple[str, int, int, bool, bool]:
+    with st.popover("Options for Searching Here"):
+        search_type = st.selectbox('Search type:', ['all', 'title', 'abstract'], index=0, key=f"{key}_search_type")
+
+        max_results = st.slider('Maximum number of results:', 1, 20, 5, key=f"{key}_max_results")
+
+        years_back = st.slider('Years back to search:', 1, 10, 3, key=f"{key}_years_back")
+
+        human_only = st.checkbox('Limit to Human Studies', value=False, key=f"{key}_human_only")
+
+        rerank = show_rerank and st.checkbox(f'Re-rank the top {RERANK_CANDIDATES} matches by my question', value=False, key=f"{key}_rerank")
+    return search_type, max_results, years_back, human_only, rerank
+
+
+# Function to show a waterfall of the spans recorded for this session's last search
+def render_performance() -> None:
+    trace = st.session_state.last_trace
+    if trace is None or not trace.spans:
+        return
+    with st.expander("Performance of the last search"):
+        spans = sorted(trace.spans, key=lambda item: item.start)
+        timeline = pd.DataFrame([
+            {
+                "span": f"{i + 1:02d} {item.name}",
+                "stage": item.name,
+                "start_ms": item.start * 1000,
+                "end_ms": (item.start + item.duration) * 1000,
+                "ms": round(item.duration * 1000, 1),
+                "details": ", ".join(f"{name}={value:.3g}" if isinstance(value, float) else f"{name}={value}" for name, value in item.attrs.items()),
+            }
+            for i, item in enumerate(spans)
+        ])
+        chart = alt.Chart(timeline).mark_bar().encode(
+            x=alt.X("start_ms", title="ms since the search started"),
+            x2="end_ms",
+            y=alt.Y("span", sort=None, title=None),
+            color="stage",
+            tooltip=["stage", "ms", "details"],
+        )
+        st.altair_chart(chart, use_container_width=True)
+        # Spans overlap when requests run concurrently, so stage totals can exceed the wall-clock time
+        st.dataframe(timeline.groupby("stage")["ms"].agg(["count", "sum", "max"]), use_container_width=True)
+
+
+# Function to run all strategies at once and show the fused results
+def multi_strategy_section() -> None:
+    col1, col2 = st.columns([1, 4])
+    with col1:
+        submit = st.button('Search All Strategies')
+    with col2:
+        search_type, max_results, years_back, human_only, _ = search_options("all")
+
+    if submit and st.session_state.original_query:
+        st.session_state.optimized_query = ""
+        st.session_state.edited_query = ""
+        st.session_state.last_trace = Trace()
+        with st.spinner('Optimizing and searching with every strategy...'):
+            articles, st.session_state.strategy_queries = run_in_background(
+                multi_strategy_search(st.session_state.original_query, search_type, max_results, years_back, human_only, session=get_background_loop().session),
+                trace=st.session_state.last_trace,
+            )
+            save_results(articles)
+    if st.session_state.strategy_queries:
+        with st.expander("PubMed search terms by strategy"):
+            for strategy, query in st.session_state.strategy_queries.items():
+                st.write(f"**{strategy}:** {query}")
+    if st.session_state.result_pmids:
+        render_results_page("all", st.session_state.last_trace if submit else None)
+    elif submit:
+        st.write("No results found.")
+
+
+# Function to list the watched searches in the sidebar, with a button to refresh them all
+def watched_searches_sidebar() -> None:
+    store = get_saved_searches()
+    with st.sidebar:
+        st.write("### Watched searches")
+        if not store.list():
+            st.caption("Use \"Watch this search\" to keep a search's results current.")
+            return
+        if st.button("Refresh all"):
+            with st.spinner('Checking PubMed for new articles...'):
+                summaries = run_in_background(refresh_all(store, get_background_loop().session))
+            refreshed = [summary for summary in summaries if "error" not in summary]
+            st.success(f"{sum(summary['new'] for summary in refreshed)} new articles across {len(refreshed)} searches")
+        for search in store.list():
+            label = f"{search['name']} ({search['new']} new)" if search['new'] else search['name']
+            st.button(label, key=f"watched_{search['id']}", use_container_width=True, on_click=show_watched_search, args=(search['id'],))
+
+
+# Function to switch the page to a watched search, or back to searching with None
+def show_watched_search(search_id: Optional[int]) -> None:
+    st.session_state.watched_search = search_id
+
+
+# Function to start watching a search; its page runs the first refresh
+def watch_search(name: str, query: str, years_back: int, human_only: bool) -> None:
+    st.session_state.watched_search = get_saved_searches().add(name, query, years_back, human_only)
+
+
+# Function to stop watching a search and go back to searching
+def stop_watching(search_id: int) -> None:
+    get_saved_searches().remove(search_id)
+    st.session_state.watched_search = None
+
+
+# Function to show a watched search's kept articles, newest first, with buttons to refresh or stop watching it
+def watched_search_section(search_id: int) -> None:
+    store = get_saved_searches()
+    search = store.get(search_id)
+    if search is None:
+        st.session_state.watched_search = None
+        return
+    st.write(f"## Watching: {search['name']}")
+    refreshed = datetime.fromtimestamp(search['last_run_at']).strftime('%Y-%m-%d %H:%M') if search['last_run_at'] else "never"
+    st.caption(f"{search['query']} · last {search['years_back']} years{' · human studies' if search['human_only'] else ''} · refreshed {refreshed}")
+    col1, col2, col3 = st.columns(3)
+    col2.button("Stop watching", on_click=stop_watching, args=(search_id,))
+    col3.button("Back to search", on_click=show_watched_search, args=(None,))
+    if col1.button("Refresh now") or not search['runs']:
+        try:
+            with st.spinner('Checking PubMed for new articles...'):
+                summary = run_in_background(refresh_saved_search(store, search_id, get_background_loop().session))
+            st.success(f"{summary['new']} new articles from {summary['checked']} PMIDs not seen before")
+            if summary['more']:
+                st.info(f"More than {search['max_results']} new PMIDs were found; refresh again to fetch the rest.")
         except Exception as e:
-            st.error(f"An unexpected error occurred: {e}")
-            return [], []
+            st.error(f"Could not check PubMed for new articles: {e}")
 
-    return articles[:max_results], list(unique_urls)
+    articles = store.results(search_id)
+    for article in articles[page_slice(len(articles), f"watched_{search_id}")]:
+        render_article(article)
+    if not articles:
+        st.write("No articles yet.")
 
-# Function to optimize the query using GPT-4o
-async def optimize_query(system_prompt=main_pubmed_prompt, search_terms=None):
-    messages = [
-        {"role": "system", "content": system_prompt},
-        {"role": "user", "content": search_terms}
-    ]
-    response = create_chat_completion(messages)
-    optimized_query = response.choices[0].message.content.strip()
-    return optimized_query
 
 def check_password() -> bool:
     """
@@ -295,41 +460,94 @@ def check_password() -> bool:
 if "optimized_query" not in st.session_state:
     st.session_state.optimized_query = ""
 
+if "optimization_stats" not in st.session_state:
+    st.session_state.optimization_stats = {}
+
 if "edited_query" not in st.session_state:
     st.session_state.edited_query = ""
     
 if "original_query" not in st.session_state:
     st.session_state.original_query = ""
     
-if "articles" not in st.session_state:
-    st.session_state.articles = []
+if "result_pmids" not in st.session_state:
+    st.session_state.result_pmids = []
+
+if "result_strategies" not in st.session_state:
+    st.session_state.result_strategies = {}
+
+if "result_facets" not in st.session_state:
+    st.session_state.result_facets = None
+
+if "strategy_queries" not in st.session_state:
+    st.session_state.strategy_queries = {}
+
+if "rerank_index" not in st.session_state:
+    st.session_state.rerank_index = BM25Index(max_documents=int(st.secrets.get("rerank_index_max_documents", 1000)))
+
+if "last_trace" not in st.session_state:
+    st.session_state.last_trace = None
+
+if "prefetch" not in st.session_state:
+    st.session_state.prefetch = None
+
+if "watched_search" not in st.session_state:
+    st.session_state.watched_search = None
+
+if "summary" not in st.session_state:
+    st.session_state.summary = None
 
 # Main function to run the Streamlit app
 def search_pubmed_page():
     st.title('PubMed Query Formulator')
+    configure_search()
+    start_metrics_server()
     
     
     if check_password():
+        watched_searches_sidebar()
+        if st.session_state.watched_search:
+            watched_search_section(st.session_state.watched_search)
+            return
         st.session_state.original_query = st.text_input('Enter your question:')
-        search_target = st.radio('Select the target of your search (note - broad may not always returns more total results):', ['general use', 'relevant clinical trials', 'review types of articles'] , index=0, horizontal=True)
-        if search_target == 'relevant clinical trials':
-            optimize_prompt = clinical_trials_prompt
-        elif search_target == 'review types of articles':
-            optimize_prompt = review_type_prompt
-        elif search_target == 'general use':
-            optimize_prompt = main_pubmed_prompt
+        search_target = st.radio('Select the target of your search (note - broad may not always returns more total results):', [*SEARCH_STRATEGIES, ALL_STRATEGIES], index=0, horizontal=True)
+        if search_target == ALL_STRATEGIES:
+            cancel_prefetch()
+            multi_strategy_section()
+            render_performance()
+            return
+        optimize_prompt = SEARCH_STRATEGIES[search_target]
+        st.session_state.strategy_queries = {}
 
         submit = st.button('Prepare Your Search')
-        if submit and st.session_state.original_query:
+        optimizing = submit and st.session_state.original_query
+        if optimizing:
             st.session_state.edited_query = ""
-            with st.spinner('Optimizing query...'):
-                        
-                optimized_query = asyncio.run(optimize_query(system_prompt=optimize_prompt, search_terms=st.session_state.original_query))
-                st.session_state.optimized_query = optimized_query
-        if st.session_state.optimized_query:
+            st.session_state.optimized_query = ""
+            st.session_state.optimization_stats = {}
+            st.session_state.last_trace = Trace()
+            cancel_prefetch()
+        if optimizing or st.session_state.optimized_query:
             with st.container(border=True):
                 st.write("### PubMed Search Terms:")
-                st.write(st.session_state.optimized_query)
+                search_terms_placeholder = st.empty()
+                if optimizing:
+                    # Resubmitting reruns the script, which stops this loop and cancels the stream on the background loop
+                    stats = {}
+                    optimized_query = ""
+                    for optimized_query in stream_in_background(optimize_query_stream(system_prompt=optimize_prompt, search_terms=st.session_state.original_query, stats=stats), trace=st.session_state.last_trace):
+                        search_terms_placeholder.write(optimized_query)
+                    st.session_state.optimized_query = optimized_query.strip()
+                    st.session_state.optimization_stats = stats
+                else:
+                    search_terms_placeholder.write(st.session_state.optimized_query)
+                stats = st.session_state.optimization_stats
+                if "cache" in stats:
+                    cache_stats = get_query_cache().stats()
+                    st.caption(f"Reused a cached {stats['cache']} match · cache hit rate {cache_stats['hit_rate']:.0%} · "
+                               f"{cache_stats['saved_seconds']:.0f}s of LLM time saved")
+                elif "total_seconds" in stats:
+                    st.caption(f"{stats.get('prompt_tokens', '?')} prompt + {stats.get('completion_tokens', '?')} completion tokens · "
+                               f"first token {stats.get('first_token_seconds', 0):.1f}s · total {stats['total_seconds']:.1f}s")
                 if st.checkbox("Edit search terms"):
                     st.session_state.edited_query = st.text_area('Edit the optimized query:', value=st.session_state.optimized_query, height=400)
                 else:
@@ -343,20 +561,62 @@ def search_pubmed_page():
             st.divider()
             st.write("**Or, perform your search here:**")
             col1, col2 = st.columns([1, 4])
+            with col2:
+                search_type, max_results, years_back, human_only, rerank = search_options("single", show_rerank=True)
             with col1:
                 start_pubmed_search = st.button("Search PubMed Here 😊")
-            with col2:
-                with st.popover("Options for Searching Here"):
-                    search_type = st.selectbox('Search type:', ['all', 'title', 'abstract'], index=0)
-                    
-                    max_results = st.slider('Maximum number of results:', 1, 20, 5)
-
-                    years_back = st.slider('Years back to search:', 1, 10, 3)
-
-                    human_only = st.checkbox('Limit to Human Studies', value=False)
-                
+                name = st.session_state.original_query or st.session_state.edited_query[:60]
+                st.button("Watch this search", help="Save it and check PubMed for new articles on each refresh",
+                          on_click=watch_search, args=(name, st.session_state.edited_query, years_back, human_only))
+
+            search_key = (st.session_state.edited_query, search_type, RERANK_CANDIDATES if rerank else max_results, years_back, human_only)
+            if st.secrets.get("speculative_prefetch", True):
+                # Most users search the terms as optimized, so the search starts while they review them;
+                # editing the terms or changing an option changes the key and cancels it
+                prefetch_search(search_key)
+            prefetched = None
             if start_pubmed_search:
-                st.session_state.articles, urls = asyncio.run(pubmed_abstracts(st.session_state.edited_query, search_type, max_results, years_back, human_only))
+                prefetched = take_prefetch(search_key)
+                st.session_state.last_trace = prefetched[1] if prefetched else Trace()
+            trace = st.session_state.last_trace
+            if start_pubmed_search and rerank:
+                with st.spinner('Fetching candidates and re-ranking...'):
+                    if prefetched:
+                        candidates = [article for _, article in sorted(prefetched[0], key=lambda item: item[0])]
+                    else:
+                        candidates, _ = run_in_background(pubmed_abstracts(st.session_state.edited_query, search_type, RERANK_CANDIDATES, years_back, human_only, session=get_background_loop().session), trace=trace)
+                    # The index lives in the session, so articles seen in earlier searches are not re-tokenized
+                    question = st.session_state.original_query or st.session_state.edited_query
+                    with traced(trace), span("rerank", candidates=len(candidates)):
+                        save_results(rerank_articles(st.session_state.rerank_index, question, candidates, max_results, RERANK_BUDGET_SECONDS))
+                render_results_page("single", trace)
+            elif start_pubmed_search:
+                # Articles arrive out of order; one placeholder per relevance rank keeps them in order on the page
+                results_container = st.container()
+                placeholders = []
+                found = {}
+                if prefetched:
+                    search = prefetched[0]
+                else:
+                    search = stream_in_background(pubmed_abstracts_stream(st.session_state.edited_query, search_type, max_results, years_back, human_only,
+                                                                          session=get_background_loop().session), trace=trace)
+                # Rendering interleaves with the search, so only the time spent writing articles is counted
+                render_start = None
+                render_seconds = 0.0
+                for rank, article in search:
+                    started = time.perf_counter()
+                    render_start = render_start or started
+                    while len(placeholders) <= rank:
+                        placeholders.append(results_container.empty())
+                    with placeholders[rank].container():
+                        render_article(article)
+                    found[rank] = article
+                    render_seconds += time.perf_counter() - started
+                if render_start:
+                    with traced(trace):
+                        record_span("render", render_start, render_seconds, articles=len(found))
+                save_results([found[rank] for rank in sorted(found)])
+                summary_section(st.session_state.result_pmids, "single")
                 # if st.session_state.articles:
                 #     with st.expander("Search used"):
                 #         st.write(f"**Original Query:** {st.session_state.original_query}")
@@ -365,14 +625,11 @@ def search_pubmed_page():
                 #         st.write(f"**Maximum Results:** {max_results}")
                 #         st.write(f"**Years Back:** {years_back}")
                 #         st.write(f"**Human Studies Only:** {human_only}")
-                articles = st.session_state.articles
-                if articles:
-                    for article in articles:
-                        st.write(f"### [{article['title']}]({article['link']})")
-                        st.write(f"**Year:** {article['year']}")
-                        st.write(f"**Abstract:** {article['abstract']}")
-                else:
-                    st.write("No results found.")
+            elif st.session_state.result_pmids:
+                render_results_page("single")
+            if start_pubmed_search and not st.session_state.result_pmids:
+                st.write("No results found.")
+        render_performance()
 
 
 search_pubmed_page()
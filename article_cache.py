@@ -0,0 +1,108 @@
+import json
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+from pubmed_parser import ArticleRecord
+
+
+class ArticleCache:
+    """
+    SQLite-backed store of parsed PubMed articles keyed by PMID.
+    Entries older than ttl_seconds are treated as misses, and once more than
+    max_entries are stored the least recently read ones are evicted.
+    ESearch ID lists are kept alongside for search_ttl_seconds, so a repeated
+    search can be answered without any network calls.
+    """
+
+    def __init__(self, path: str = "article_cache.sqlite3", ttl_seconds: float = 7 * 24 * 3600, max_entries: int = 50000, search_ttl_seconds: float = 3600) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.search_ttl_seconds = search_ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # One connection shared by every Streamlit session thread, serialized by the lock
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS articles ("
+            "pmid TEXT PRIMARY KEY, record TEXT NOT NULL, fetched_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS articles_accessed_at ON articles (accessed_at)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS searches (query TEXT PRIMARY KEY, result TEXT NOT NULL, fetched_at REAL NOT NULL)")
+        self._conn.commit()
+
+    def get_many(self, pmids: List[str]) -> Dict[str, ArticleRecord]:
+        if not pmids:
+            return {}
+        now = time.time()
+        placeholders = ",".join("?" * len(pmids))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT pmid, record FROM articles WHERE pmid IN ({placeholders}) AND fetched_at >= ?",
+                [*pmids, now - self.ttl_seconds],
+            ).fetchall()
+            found = {pmid: record for pmid, record in ((pmid, record_from_json(data)) for pmid, data in rows) if record is not None}
+            if found:
+                self._conn.executemany("UPDATE articles SET accessed_at = ? WHERE pmid = ?", [(now, pmid) for pmid in found])
+                self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(pmids) - len(found)
+        return found
+
+    def put_many(self, records: Iterable[ArticleRecord]) -> None:
+        now = time.time()
+        rows = [(record.pmid, json.dumps(record._asdict()), now, now) for record in records if record.pmid]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO articles VALUES (?, ?, ?, ?)", rows)
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        self._conn.execute("DELETE FROM articles WHERE fetched_at < ?", (time.time() - self.ttl_seconds,))
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM articles").fetchone()
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM articles WHERE pmid IN (SELECT pmid FROM articles ORDER BY accessed_at LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def get_search(self, query: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT result FROM searches WHERE query = ? AND fetched_at >= ?",
+                (query, time.time() - self.search_ttl_seconds),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_search(self, query: str, result: Dict) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM searches WHERE fetched_at < ?", (time.time() - self.search_ttl_seconds,))
+            self._conn.execute("INSERT OR REPLACE INTO searches VALUES (?, ?, ?)", (query, json.dumps(result), time.time()))
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            (size,) = self._conn.execute("SELECT COUNT(*) FROM articles").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": size,
+        }
+
+
+# Function to rebuild an ArticleRecord from its stored JSON form; None for entries cached before journals, MeSH etc. were parsed
+def record_from_json(data: str) -> Optional[ArticleRecord]:
+    fields = json.loads(data)
+    if "publication_types" not in fields:
+        return None  # Read as a miss, so the article is fetched again with every field
+    fields["sections"] = [tuple(section) for section in fields["sections"]]
+    for name in ("authors", "publication_types", "mesh_terms"):
+        fields[name] = tuple(fields[name])
+    return ArticleRecord(**fields)
@@ -0,0 +1,90 @@
+import asyncio
+import concurrent.futures
+import queue
+import threading
+from typing import Any, AsyncIterator, Coroutine, Iterator, Optional
+
+import aiohttp
+
+
+class BackgroundLoop:
+    """
+    Event loop running forever in a daemon thread, holding one pooled aiohttp session.
+    Coroutines from any thread are submitted with submit() and come back as futures,
+    so every search reuses the same keep-alive connections to NCBI.
+    """
+
+    def __init__(self, limit: int = 100, limit_per_host: int = 10, keepalive_timeout: float = 30, dns_cache_ttl: int = 300) -> None:
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="background-loop", daemon=True)
+        self._thread.start()
+        self.session = self.run(self._create_session(limit, limit_per_host, keepalive_timeout, dns_cache_ttl))
+
+    @staticmethod
+    async def _create_session(limit: int, limit_per_host: int, keepalive_timeout: float, dns_cache_ttl: int) -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(
+            limit=limit,
+            limit_per_host=limit_per_host,
+            keepalive_timeout=keepalive_timeout,
+            ttl_dns_cache=dns_cache_ttl,
+        )
+        return aiohttp.ClientSession(connector=connector)
+
+    def submit(self, coro: Coroutine) -> concurrent.futures.Future:
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro: Coroutine, timeout: Optional[float] = None) -> Any:
+        return self.submit(coro).result(timeout)
+
+    def iterate(self, agen: AsyncIterator) -> Iterator:
+        """Drive an async generator on the loop and yield its items in the calling thread as they arrive."""
+        yield from self.start_stream(agen)
+
+    def start_stream(self, agen: AsyncIterator) -> "BufferedStream":
+        """Start driving an async generator on the loop now, buffering its items until they are iterated."""
+        return BufferedStream(self, agen)
+
+    def close(self) -> None:
+        self.run(self.session.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+
+
+class BufferedStream:
+    """
+    Async generator running on a BackgroundLoop whose items queue up until another thread iterates
+    it once: iteration yields what has already arrived, then the rest as it comes. Stopping the
+    iteration early, or cancel(), stops the generator.
+    """
+
+    _done = object()
+
+    def __init__(self, background_loop: BackgroundLoop, agen: AsyncIterator) -> None:
+        self._items: queue.Queue = queue.Queue()
+        self.future = background_loop.submit(self._drain(agen))
+        # Also ends iteration when the stream is cancelled before it ever ran
+        self.future.add_done_callback(lambda _: self._items.put((self._done, None)))
+
+    async def _drain(self, agen: AsyncIterator) -> None:
+        try:
+            async for item in agen:
+                self._items.put((item, None))
+        except BaseException as e:
+            self._items.put((self._done, e))
+            raise
+
+    def __iter__(self) -> Iterator:
+        try:
+            while True:
+                item, error = self._items.get()
+                if item is self._done:
+                    if error is not None and not isinstance(error, asyncio.CancelledError):
+                        raise error
+                    return
+                yield item
+        finally:
+            # Stop the producer if the caller stopped consuming early
+            self.future.cancel()
+
+    def cancel(self) -> None:
+        self.future.cancel()
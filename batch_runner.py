@@ -0,0 +1,194 @@
+"""
+Headless batch runner: optimize and search a file of questions without the Streamlit UI.
+
+    python batch_runner.py questions.csv -o results.jsonl
+
+Questions come from a CSV with a "question" column or a JSONL file of {"question": ...} objects;
+an "id" column/field is used when present, otherwise the row number. Results are appended to the
+output as each question finishes, so rerunning the same command resumes an interrupted run.
+Reads NCBI_API_KEY and OPENAI_API_KEY (and EUTILS_BASE_URL / OPENAI_BASE_URL) from the environment.
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import sys
+import time
+from typing import Dict, List
+
+import aiohttp
+
+from metrics import metrics
+from pubmed_search import SEARCH_STRATEGIES, optimize_query, pubmed_abstracts, search_notices
+
+
+# Function to read questions from a CSV or JSONL file
+def read_questions(path: str) -> List[Dict[str, str]]:
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = list(csv.DictReader(f))
+    return [
+        {"id": str(row.get("id") or i), "question": row["question"].strip(), "strategy": row.get("strategy") or ""}
+        for i, row in enumerate(rows, start=1)
+        if row.get("question", "").strip()
+    ]
+
+
+# Function to read the results written to a checkpoint, skipping a line cut short by an interrupted write
+def read_checkpoint(checkpoint_path: str) -> List[Dict]:
+    if not os.path.exists(checkpoint_path):
+        return []
+    rows = []
+    with open(checkpoint_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(row, dict) and "id" in row:
+                rows.append(row)
+    return rows
+
+
+# Function to read the IDs already written to a checkpoint, so an interrupted run resumes where it stopped
+def completed_ids(checkpoint_path: str) -> set:
+    return {row["id"] for row in read_checkpoint(checkpoint_path)}
+
+
+# Function to cut a checkpoint back to its last complete line, so appended results do not run on from a partial write
+def drop_partial_line(checkpoint_path: str) -> None:
+    if not os.path.exists(checkpoint_path):
+        return
+    with open(checkpoint_path, "rb+") as f:
+        end = f.seek(0, os.SEEK_END)
+        # Scan back from the end in blocks; only the unfinished last line is read
+        position = end
+        while position > 0:
+            start = max(0, position - 64 * 1024)
+            f.seek(start)
+            block = f.read(position - start)
+            newline = block.rfind(b"\n")
+            if newline != -1:
+                position = start + newline + 1
+                break
+            position = start
+        if position < end:
+            f.truncate(position)
+
+
+# Function to optimize and search one question, holding each stage's semaphore only while that stage runs
+async def run_question(item: Dict[str, str], session: aiohttp.ClientSession, llm_semaphore: asyncio.Semaphore, search_semaphore: asyncio.Semaphore,
+                       strategy: str, max_results: int, years_back: int, human_only: bool) -> Dict:
+    notices = []
+    search_notices.set(notices)
+    strategy = item["strategy"] or strategy
+    start = time.perf_counter()
+
+    stats = {}
+    async with llm_semaphore:
+        optimized_query = await optimize_query(system_prompt=SEARCH_STRATEGIES[strategy], search_terms=item["question"], stats=stats)
+    search_stats = {}
+    async with search_semaphore:
+        articles, _ = await pubmed_abstracts(optimized_query, max_results=max_results, years_back=years_back, human_only=human_only, session=session,
+                                             stats=search_stats)
+    if "error" in search_stats:
+        # Raised rather than saved as an empty result, so the question stays out of the checkpoint and the next run retries it
+        raise RuntimeError(search_stats["error"])
+
+    return {
+        "id": item["id"],
+        "question": item["question"],
+        "strategy": strategy,
+        "optimized_query": optimized_query,
+        "articles": articles,
+        "notices": [message for _, message in notices],
+        "llm_cache": stats.get("cache", ""),
+        "llm_seconds": stats.get("total_seconds", 0.0),
+        "seconds": time.perf_counter() - start,
+    }
+
+
+# Function to convert the JSONL checkpoint into a Parquet file
+def write_parquet(checkpoint_path: str, output_path: str) -> None:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    pq.write_table(pa.Table.from_pylist(read_checkpoint(checkpoint_path)), output_path)
+
+
+# Function to run every question in a file through optimization and retrieval, returning throughput figures
+async def run_batch(questions_path: str, output_path: str, strategy: str = "general use", max_results: int = 5, years_back: int = 3,
+                    human_only: bool = False, llm_concurrency: int = 8, search_concurrency: int = 4) -> Dict[str, float]:
+    # Parquet cannot be appended to, so results are checkpointed as JSONL and converted at the end
+    checkpoint_path = output_path if output_path.endswith(".jsonl") else f"{output_path}.jsonl"
+    questions = read_questions(questions_path)
+    drop_partial_line(checkpoint_path)
+    done = completed_ids(checkpoint_path)
+    pending = [item for item in questions if item["id"] not in done]
+
+    llm_semaphore = asyncio.Semaphore(llm_concurrency)
+    search_semaphore = asyncio.Semaphore(search_concurrency)
+    completed = failed = 0
+    start = time.perf_counter()
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit_per_host=10, ttl_dns_cache=300)) as session:
+        tasks = [
+            asyncio.create_task(run_question(item, session, llm_semaphore, search_semaphore, strategy, max_results, years_back, human_only))
+            for item in pending
+        ]
+        with open(checkpoint_path, "a", encoding="utf-8") as out:
+            for task in asyncio.as_completed(tasks):
+                try:
+                    result = await task
+                except Exception as e:
+                    # Left out of the checkpoint so the next run retries it
+                    failed += 1
+                    print(f"Question failed: {e}", file=sys.stderr)
+                    continue
+                out.write(json.dumps(result) + "\n")
+                out.flush()
+                completed += 1
+                if completed % 10 == 0:
+                    rate = completed / (time.perf_counter() - start) * 60
+                    print(f"{completed}/{len(pending)} questions, {rate:.1f} questions/min", file=sys.stderr)
+
+    if not output_path.endswith(".jsonl"):
+        write_parquet(checkpoint_path, output_path)
+
+    elapsed = time.perf_counter() - start
+    return {
+        "completed": completed,
+        "failed": failed,
+        "skipped": len(questions) - len(pending),
+        "seconds": elapsed,
+        "questions_per_minute": completed / elapsed * 60 if elapsed else 0.0,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run a file of questions through PubMed query optimization and retrieval.")
+    parser.add_argument("questions", help="CSV with a 'question' column, or JSONL of {\"question\": ...} objects")
+    parser.add_argument("-o", "--output", required=True, help="Output .jsonl or .parquet file")
+    parser.add_argument("--strategy", choices=list(SEARCH_STRATEGIES), default="general use")
+    parser.add_argument("--max-results", type=int, default=5)
+    parser.add_argument("--years-back", type=int, default=3)
+    parser.add_argument("--human-only", action="store_true")
+    parser.add_argument("--llm-concurrency", type=int, default=8)
+    parser.add_argument("--search-concurrency", type=int, default=4)
+    parser.add_argument("--metrics-out", help="Write Prometheus-format metrics to this file when the run ends (e.g. for node_exporter's textfile collector)")
+    args = parser.parse_args()
+
+    summary = asyncio.run(run_batch(
+        args.questions, args.output, args.strategy, args.max_results, args.years_back,
+        args.human_only, args.llm_concurrency, args.search_concurrency,
+    ))
+    if args.metrics_out:
+        with open(args.metrics_out, "w", encoding="utf-8") as f:
+            f.write(metrics.render())
+    print(json.dumps(summary))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,398 @@
+"""
+Benchmark query optimization and retrieval against local mock E-utilities and OpenAI servers.
+
+    python benchmark.py --sizes 5,20,200 --users 1,10,50 --json bench.json
+    python benchmark.py --baseline bench.json   # exits 1 if any scenario's p95 regressed
+
+Every scenario starts with empty caches. Each simulated user optimizes a distinct question and
+retrieves max_results articles through the shared session and rate limiter, as the app does.
+Record a fixture from live NCBI to replay real article XML:
+
+    python benchmark.py record "statins elderly" fixture.xml --count 200
+
+Compare batched EFetch retrieval with one request per PMID (batch size 1):
+
+    python benchmark.py batching --sizes 20,100
+
+Time local BM25 re-ranking of candidate pools of each size, with a cold and a warm index:
+
+    python benchmark.py rerank --sizes 200,1000,5000
+
+Time the streaming EFetch parser on a large PubmedArticleSet against one full ElementTree parse,
+and against the old per-PMID reparse timed on a sample of PMIDs and extrapolated (--old-sample 0 skips it):
+
+    python benchmark.py parse --count 10000 --old-sample 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+from typing import Dict, List, Optional, Tuple
+
+import aiohttp
+import numpy as np
+from openai import AsyncOpenAI
+
+import pubmed_search
+from article_cache import ArticleCache
+from mock_servers import MockChatCompletions, MockEutils, start_server
+from pubmed_parser import iter_pubmed_articles
+from pubmed_search import FETCH_BATCH_SIZE, configure, optimize_query, pubmed_abstracts, search_client
+from query_cache import QueryCache
+from rate_limiter import RateLimiter
+from rerank import BM25Index, rerank_articles
+
+RERANK_QUESTION = "statin use and cardiovascular mortality in elderly patients"
+
+
+# Function to run one simulated user's question through optimization and retrieval, returning stage timings
+async def run_user(user: str, question: str, max_results: int, session: aiohttp.ClientSession) -> Dict[str, float]:
+    search_client.set(user)
+    start = time.perf_counter()
+    optimized_query = await optimize_query(search_terms=question)
+    optimized = time.perf_counter()
+    articles, _ = await pubmed_abstracts(optimized_query, max_results=max_results, session=session)
+    finished = time.perf_counter()
+    return {"optimize": optimized - start, "search": finished - optimized, "total": finished - start, "articles": len(articles)}
+
+
+# Function to summarize a list of latencies in milliseconds
+def latency_summary(seconds: List[float]) -> Dict[str, float]:
+    values = np.array(seconds) * 1000
+    return {"p50_ms": float(np.percentile(values, 50)), "p95_ms": float(np.percentile(values, 95)), "max_ms": float(values.max())}
+
+
+# Function to run one scenario of concurrent users on fresh caches and report latency, request counts and throughput
+async def run_scenario(eutils: MockEutils, chat: MockChatCompletions, openai_client: AsyncOpenAI, max_results: int, users: int, rate: float) -> Dict:
+    eutils_before = dict(eutils.counts)
+    bytes_before = eutils.bytes_sent
+    chat_before = chat.counts["requests"]
+    with tempfile.TemporaryDirectory() as cache_dir:
+        configure(
+            article_cache=ArticleCache(os.path.join(cache_dir, "articles.sqlite3")),
+            query_cache=QueryCache(os.path.join(cache_dir, "queries.sqlite3")),
+            rate_limiter=RateLimiter(rate=rate),
+            openai_client=openai_client,
+        )
+        # Matches the pool the app's background loop uses
+        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=100, limit_per_host=10)) as session:
+            start = time.perf_counter()
+            results = await asyncio.gather(*(
+                run_user(f"user-{i}", f"statin therapy in older adults cohort {max_results}x{users}u{i}", max_results, session)
+                for i in range(users)
+            ))
+            elapsed = time.perf_counter() - start
+
+    requests = {endpoint: eutils.counts[endpoint] - eutils_before[endpoint] for endpoint in eutils.counts}
+    return {
+        "scenario": f"{max_results} results x {users} users",
+        "max_results": max_results,
+        "users": users,
+        "total": latency_summary([result["total"] for result in results]),
+        "optimize": latency_summary([result["optimize"] for result in results]),
+        "search": latency_summary([result["search"] for result in results]),
+        "articles_per_user": min(result["articles"] for result in results),
+        "eutils_requests": requests,
+        "llm_requests": chat.counts["requests"] - chat_before,
+        "response_mb": (eutils.bytes_sent - bytes_before) / 1e6,
+        "seconds": elapsed,
+        "searches_per_second": users / elapsed,
+    }
+
+
+# Function to run every combination of result size and user count against freshly started mock servers
+async def run_benchmark(sizes: List[int], user_counts: List[int], rate: float, latency: float, throttle_rate: float, abstract_words: int,
+                        token_delay: float, fixture_path: Optional[str] = None, seed: int = 0) -> List[Dict]:
+    eutils = MockEutils(latency=latency, throttle_rate=throttle_rate, abstract_words=abstract_words, fixture_path=fixture_path, seed=seed)
+    chat = MockChatCompletions(token_delay=token_delay)
+    eutils_runner = await start_server(eutils.app(), 0)
+    chat_runner = await start_server(chat.app(), 0)
+    pubmed_search.EUTILS_BASE_URL = "http://{}:{}".format(*eutils_runner.addresses[0])
+    openai_client = AsyncOpenAI(base_url="http://{}:{}/v1".format(*chat_runner.addresses[0]), api_key="benchmark", max_retries=0)
+    try:
+        scenarios = []
+        for max_results in sizes:
+            for users in user_counts:
+                scenario = await run_scenario(eutils, chat, openai_client, max_results, users, rate)
+                print(format_scenario(scenario), file=sys.stderr)
+                scenarios.append(scenario)
+        return scenarios
+    finally:
+        await openai_client.close()
+        await eutils_runner.cleanup()
+        await chat_runner.cleanup()
+
+
+# Function to format one scenario as a line of the report
+def format_scenario(scenario: Dict) -> str:
+    requests = scenario["eutils_requests"]
+    return (
+        f"{scenario['scenario']:>24}: total p50 {scenario['total']['p50_ms']:7.0f} ms  p95 {scenario['total']['p95_ms']:7.0f} ms | "
+        f"search p50 {scenario['search']['p50_ms']:7.0f} ms  p95 {scenario['search']['p95_ms']:7.0f} ms | "
+        f"esearch {requests['esearch']:3d}  efetch {requests['efetch']:3d}  429s {requests['throttled']:3d}  llm {scenario['llm_requests']:3d} | "
+        f"{scenario['response_mb']:6.1f} MB | {scenario['searches_per_second']:6.2f} searches/s"
+    )
+
+
+# Function to list scenarios whose p95 total latency grew by more than the tolerance over a saved baseline
+def regressions(scenarios: List[Dict], baseline: List[Dict], tolerance: float) -> List[str]:
+    previous = {item["scenario"]: item for item in baseline}
+    found = []
+    for scenario in scenarios:
+        before = previous.get(scenario["scenario"])
+        if before and scenario["total"]["p95_ms"] > before["total"]["p95_ms"] * (1 + tolerance):
+            found.append(f"{scenario['scenario']}: p95 {before['total']['p95_ms']:.0f} ms -> {scenario['total']['p95_ms']:.0f} ms")
+    return found
+
+
+# Function to save live EFetch XML for a query, to replay through MockEutils
+async def record_fixture(query: str, output_path: str, count: int) -> int:
+    async with aiohttp.ClientSession() as session:
+        result = await pubmed_search.esearch(session, query, count)
+        ids = result.get("idlist", [])
+        params = {"db": "pubmed", "id": ",".join(ids), "retmode": "xml", "rettype": "abstract", "api_key": pubmed_search.get_pubmed_api_key()}
+        async with pubmed_search.eutils_request(session, f"{pubmed_search.EUTILS_BASE_URL}/efetch.fcgi", data=params) as response:
+            xml_data = await response.read()
+    with open(output_path, "wb") as f:
+        f.write(xml_data)
+    return len(ids)
+
+
+# Function to compare request counts and latency of per-PMID and batched retrieval for each result size, on fresh caches
+async def batching_benchmark(sizes: List[int], batch_sizes: List[int], rate: float, latency: float) -> List[Dict]:
+    eutils = MockEutils(latency=latency)
+    runner = await start_server(eutils.app(), 0)
+    pubmed_search.EUTILS_BASE_URL = "http://{}:{}".format(*runner.addresses[0])
+    results = []
+    try:
+        for max_results in sizes:
+            for batch_size in batch_sizes:
+                before = dict(eutils.counts)
+                with tempfile.TemporaryDirectory() as cache_dir:
+                    configure(article_cache=ArticleCache(os.path.join(cache_dir, "articles.sqlite3")), rate_limiter=RateLimiter(rate=rate))
+                    async with aiohttp.ClientSession() as session:
+                        start = time.perf_counter()
+                        articles, _ = await pubmed_abstracts(f"batching benchmark {max_results}", max_results=max_results, batch_size=batch_size,
+                                                             session=session)
+                        elapsed = time.perf_counter() - start
+                requests = {endpoint: eutils.counts[endpoint] - before[endpoint] for endpoint in eutils.counts}
+                results.append({"max_results": max_results, "batch_size": batch_size, "articles": len(articles), "seconds": elapsed,
+                                "requests": requests["esearch"] + requests["esummary"] + requests["efetch"], "eutils_requests": requests})
+                print(f"{max_results:>5} results, batch size {batch_size:>3}: {results[-1]['requests']:4d} requests "
+                      f"(esearch {requests['esearch']}, efetch {requests['efetch']}), {elapsed * 1000:7.0f} ms, {len(articles)} articles", file=sys.stderr)
+    finally:
+        await runner.cleanup()
+    return results
+
+
+# Function to generate candidate articles with Zipf-distributed words, so BM25 sees realistic term frequencies
+def synthetic_articles(count: int, abstract_words: int = 250, seed: int = 0) -> List[Dict[str, str]]:
+    rng = random.Random(seed)
+    vocabulary = [f"w{i}" for i in range(20000)] + RERANK_QUESTION.split()
+    weights = [1 / (i + 1) for i in range(len(vocabulary))]
+    return [
+        {
+            "pmid": str(i),
+            "link": f"https://pubmed.ncbi.nlm.nih.gov/{i}",
+            "title": " ".join(rng.choices(vocabulary, weights, k=12)),
+            "abstract": " ".join(rng.choices(vocabulary, weights, k=abstract_words)),
+            "year": "2023",
+        }
+        for i in range(count)
+    ]
+
+
+# Function to time re-ranking each pool size with a cold index, a warm one, and a cold one under the app's budget
+def rerank_benchmark(sizes: List[int], top_k: int = 20, budget_seconds: float = 0.5) -> List[Dict]:
+    results = []
+    for size in sizes:
+        articles = synthetic_articles(size)
+        index = BM25Index(max_documents=size)
+        start = time.perf_counter()
+        rerank_articles(index, RERANK_QUESTION, articles, top_k, budget_seconds=float("inf"))
+        cold = time.perf_counter() - start
+        start = time.perf_counter()
+        rerank_articles(index, RERANK_QUESTION, articles, top_k)
+        warm = time.perf_counter() - start
+        start = time.perf_counter()
+        rerank_articles(BM25Index(max_documents=size), RERANK_QUESTION, articles, top_k, budget_seconds=budget_seconds)
+        budgeted = time.perf_counter() - start
+        tracemalloc.start()
+        index = BM25Index(max_documents=size)
+        index.add(articles)
+        index_bytes, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results.append({"candidates": size, "cold_ms": cold * 1000, "warm_ms": warm * 1000, "budgeted_ms": budgeted * 1000,
+                        "index_mb": index_bytes / 1e6})
+        print(f"{size:>6} candidates: cold {cold * 1000:7.1f} ms | warm {warm * 1000:6.2f} ms | "
+              f"cold with {budget_seconds:g} s budget {budgeted * 1000:6.0f} ms | index {index_bytes / 1e6:5.1f} MB", file=sys.stderr)
+    return results
+
+
+# Function to read the process's peak resident set size in MB; ru_maxrss is in KB on Linux and bytes on macOS
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1e6 if sys.platform == "darwin" else peak / 1e3
+
+
+# Function to time and measure the memory of a parse, returning (result, seconds, tracemalloc peak MB, peak RSS growth MB).
+# Peak RSS never goes down, so its growth is only meaningful for parses run in increasing order of memory use.
+def measure(parse, *args) -> Tuple[object, float, float, float]:
+    rss_before = peak_rss_mb()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = parse(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak / 1e6, peak_rss_mb() - rss_before
+
+
+# Function to find one PMID's abstract the way the code before the streaming parser did: parse the whole payload, then scan it
+def per_pmid_abstract(xml_data: bytes, pmid: str) -> str:
+    root = ET.fromstring(xml_data)
+    for article in root.findall(".//PubmedArticle"):
+        pmid_element = article.find("MedlineCitation/PMID")
+        if pmid_element is not None and pmid_element.text == pmid:
+            abstract_texts = []
+            for elem in article.findall("MedlineCitation/Article/Abstract/AbstractText"):
+                text = ET.tostring(elem, encoding='unicode', method='text').strip()
+                abstract_texts.append(f"{elem.get('Label')}: {text}" if elem.get("Label") else text)
+            return " ".join(abstract_texts).strip()
+    return "No abstract available"
+
+
+# Function to compare the streaming parser with a whole-document ElementTree parse on a generated PubmedArticleSet,
+# and with the old per-PMID reparse timed on old_sample PMIDs and extrapolated to the whole set
+def parse_benchmark(count: int, abstract_words: int = 250, fixture_path: Optional[str] = None, old_sample: int = 5) -> Dict:
+    eutils = MockEutils(abstract_words=abstract_words, fixture_path=fixture_path)
+    pmids = [str(10000000 + i) for i in range(count)]
+    xml_data = ("<?xml version=\"1.0\"?><PubmedArticleSet>" + "".join(eutils.article_xml(pmid) for pmid in pmids)
+                + "</PubmedArticleSet>").encode()
+    # Timed without tracemalloc too, since tracing slows allocation-heavy parsing several-fold
+    start = time.perf_counter()
+    parsed = sum(1 for _ in iter_pubmed_articles(xml_data))
+    streaming_seconds = time.perf_counter() - start
+    _, _, streaming_peak, streaming_rss = measure(lambda data: sum(1 for _ in iter_pubmed_articles(data)), xml_data)
+    start = time.perf_counter()
+    ET.fromstring(xml_data)
+    tree_seconds = time.perf_counter() - start
+    _, _, tree_peak, tree_rss = measure(ET.fromstring, xml_data)
+    result = {
+        "articles": parsed, "payload_mb": len(xml_data) / 1e6,
+        "streaming_seconds": streaming_seconds, "streaming_articles_per_second": parsed / streaming_seconds,
+        "streaming_peak_mb": streaming_peak, "streaming_rss_growth_mb": streaming_rss,
+        "tree_seconds": tree_seconds, "tree_peak_mb": tree_peak, "tree_rss_growth_mb": tree_rss,
+    }
+    print(f"{parsed} articles ({result['payload_mb']:.1f} MB): streaming parser {streaming_seconds:.2f} s "
+          f"({result['streaming_articles_per_second']:,.0f} articles/s), peak {streaming_peak:.1f} MB, RSS +{streaming_rss:.1f} MB | "
+          f"one ElementTree parse of the whole set {tree_seconds:.2f} s, peak {tree_peak:.1f} MB, RSS +{tree_rss:.1f} MB", file=sys.stderr)
+
+    if old_sample > 0:
+        # Spread the sample over the set, since the old scan stops at the PMID it looks for
+        sample = pmids[::max(1, count // old_sample)][:old_sample]
+        start = time.perf_counter()
+        for pmid in sample:
+            per_pmid_abstract(xml_data, pmid)
+        per_pmid_seconds = (time.perf_counter() - start) / len(sample)
+        result.update({"old_sample": len(sample), "old_seconds_per_article": per_pmid_seconds,
+                       "old_extrapolated_seconds": per_pmid_seconds * parsed})
+        print(f"old per-PMID reparse: {per_pmid_seconds:.2f} s per article over {len(sample)} PMIDs, "
+              f"about {per_pmid_seconds * parsed / 60:,.1f} min extrapolated to all {parsed} "
+              f"({per_pmid_seconds * parsed / streaming_seconds:,.0f}x the streaming parser)", file=sys.stderr)
+    else:
+        print("old per-PMID reparse: skipped (--old-sample 0)", file=sys.stderr)
+    return result
+
+
+def main() -> None:
+    if sys.argv[1:2] == ["batching"]:
+        parser = argparse.ArgumentParser(prog="benchmark.py batching", description="Compare per-PMID and batched retrieval against mock E-utilities.")
+        parser.add_argument("--sizes", default="20,100", help="Comma-separated max_results values")
+        parser.add_argument("--batch-sizes", default=f"1,{FETCH_BATCH_SIZE}", help="Comma-separated PMIDs per EFetch request")
+        parser.add_argument("--rate", type=float, default=10, help="Rate limiter requests/second (NCBI allows 10 with an API key)")
+        parser.add_argument("--latency", type=float, default=0.05, help="Mock E-utilities latency per request, in seconds")
+        parser.add_argument("--json", help="Write the results to this file")
+        args = parser.parse_args(sys.argv[2:])
+        results = asyncio.run(batching_benchmark([int(size) for size in args.sizes.split(",")], [int(size) for size in args.batch_sizes.split(",")],
+                                                 args.rate, args.latency))
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2)
+        return
+
+    if sys.argv[1:2] == ["parse"]:
+        parser = argparse.ArgumentParser(prog="benchmark.py parse", description="Time the streaming EFetch parser on a generated PubmedArticleSet.")
+        parser.add_argument("--count", type=int, default=10000, help="Articles in the generated set")
+        parser.add_argument("--abstract-words", type=int, default=250, help="Words per generated abstract")
+        parser.add_argument("--fixture", help="Recorded EFetch XML to replay instead of generated articles")
+        parser.add_argument("--old-sample", type=int, default=5, help="PMIDs to time the old per-PMID reparse on and extrapolate from; 0 skips it")
+        parser.add_argument("--json", help="Write the results to this file")
+        args = parser.parse_args(sys.argv[2:])
+        result = parse_benchmark(args.count, args.abstract_words, args.fixture, args.old_sample)
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(result, f, indent=2)
+        return
+
+    if sys.argv[1:2] == ["rerank"]:
+        parser = argparse.ArgumentParser(prog="benchmark.py rerank", description="Time local BM25 re-ranking of synthetic candidate pools.")
+        parser.add_argument("--sizes", default="200,1000,5000", help="Comma-separated candidate pool sizes")
+        parser.add_argument("--budget", type=float, default=0.5, help="Re-ranking latency budget in seconds, as in the app")
+        parser.add_argument("--json", help="Write the results to this file")
+        args = parser.parse_args(sys.argv[2:])
+        results = rerank_benchmark([int(size) for size in args.sizes.split(",")], budget_seconds=args.budget)
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2)
+        return
+
+    if sys.argv[1:2] == ["record"]:
+        parser = argparse.ArgumentParser(prog="benchmark.py record", description="Save live EFetch XML for a query as a replay fixture.")
+        parser.add_argument("query")
+        parser.add_argument("output")
+        parser.add_argument("--count", type=int, default=200)
+        args = parser.parse_args(sys.argv[2:])
+        print(f"Recorded {asyncio.run(record_fixture(args.query, args.output, args.count))} articles to {args.output}")
+        return
+
+    parser = argparse.ArgumentParser(description="Benchmark the search pipeline against local mock servers.")
+    parser.add_argument("--sizes", default="5,20,200", help="Comma-separated max_results values")
+    parser.add_argument("--users", default="1,10,50", help="Comma-separated concurrent user counts")
+    parser.add_argument("--rate", type=float, default=10, help="Rate limiter requests/second (NCBI allows 10 with an API key)")
+    parser.add_argument("--latency", type=float, default=0.05, help="Mock E-utilities latency per request, in seconds")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Share of E-utilities requests answered with 429")
+    parser.add_argument("--abstract-words", type=int, default=250, help="Words per generated abstract")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="Mock LLM seconds per streamed token")
+    parser.add_argument("--fixture", help="Recorded EFetch XML to replay instead of generated articles")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--baseline", help="Results JSON from an earlier run to compare p95 latency against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed p95 growth over the baseline")
+    args = parser.parse_args()
+
+    scenarios = asyncio.run(run_benchmark(
+        [int(size) for size in args.sizes.split(",")], [int(users) for users in args.users.split(",")],
+        args.rate, args.latency, args.throttle_rate, args.abstract_words, args.token_delay, args.fixture, args.seed,
+    ))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(scenarios, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            found = regressions(scenarios, json.load(f), args.tolerance)
+        for line in found:
+            print(f"Regression: {line}", file=sys.stderr)
+        if found:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Facets with several values per article, kept in long form (one row per article and value)
+MULTI_VALUE_FACETS = ("publication_types", "mesh_terms")
+
+
+class FacetIndex:
+    """
+    Facet values for one result set as NumPy arrays and pandas categoricals, so counting and
+    narrowing by publication type, MeSH term, journal and year are vectorized and need no requests.
+    """
+
+    def __init__(self, articles: List[Dict]) -> None:
+        self.pmids = np.array([article['pmid'] for article in articles], dtype=object)
+        self.years = pd.to_numeric(pd.Series([article['year'] for article in articles], dtype=object), errors="coerce").to_numpy()
+        self.journals = pd.Categorical([article.get('journal') or "Unknown" for article in articles])
+        self._long: Dict[str, Tuple[np.ndarray, pd.Categorical]] = {}
+        for facet in MULTI_VALUE_FACETS:
+            values = [article.get(facet) or () for article in articles]
+            rows = np.repeat(np.arange(len(articles)), [len(article_values) for article_values in values])
+            self._long[facet] = (rows, pd.Categorical([value for article_values in values for value in article_values]))
+
+    def __len__(self) -> int:
+        return len(self.pmids)
+
+    def mask(self, selected: Dict[str, List[str]], years: Optional[Tuple[int, int]] = None) -> np.ndarray:
+        """Articles having any selected value of every facet with a selection, published within years."""
+        keep = np.ones(len(self), dtype=bool)
+        for facet, values in selected.items():
+            if not values:
+                continue
+            if facet == "journal":
+                keep &= np.asarray(self.journals.isin(values))
+            else:
+                rows, facet_values = self._long[facet]
+                matched = np.zeros(len(self), dtype=bool)
+                matched[rows[np.asarray(facet_values.isin(values))]] = True
+                keep &= matched
+        if years is not None:
+            # NaN years (unparseable dates) compare False, so they drop out of any year filter
+            keep &= (self.years >= years[0]) & (self.years <= years[1])
+        return keep
+
+    def counts(self, facet: str, mask: Optional[np.ndarray] = None, top: Optional[int] = None) -> pd.Series:
+        """Number of articles with each value of a facet among those in mask, most common first."""
+        if mask is None:
+            mask = np.ones(len(self), dtype=bool)
+        if facet == "journal":
+            counts = pd.Series(self.journals[mask]).value_counts()
+        else:
+            rows, facet_values = self._long[facet]
+            counts = pd.Series(facet_values[mask[rows]]).value_counts()
+        counts = counts[counts > 0]
+        counts.index = counts.index.astype(str)
+        return counts.head(top) if top else counts
+
+    def year_histogram(self, mask: Optional[np.ndarray] = None) -> pd.Series:
+        """Articles per publication year among those in mask, in year order."""
+        years = self.years if mask is None else self.years[mask]
+        years = years[~np.isnan(years)].astype(int)
+        if not len(years):
+            return pd.Series(dtype=int)
+        first = years.min()
+        return pd.Series(np.bincount(years - first), index=np.arange(first, years.max() + 1))
+
+    def year_range(self) -> Optional[Tuple[int, int]]:
+        years = self.years[~np.isnan(self.years)]
+        return (int(years.min()), int(years.max())) if len(years) else None
@@ -0,0 +1,155 @@
+import contextlib
+import contextvars
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from aiohttp import web
+
+# Upper bounds in seconds; wide enough for a rate-limited EFetch of several hundred articles
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+class Span(NamedTuple):
+    name: str
+    start: float  # Seconds since the trace started
+    duration: float
+    attrs: Dict[str, object]
+
+
+class Trace:
+    """Spans recorded for one search, in the order they finished, for the in-app waterfall."""
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.spans: List[Span] = []
+
+    def add(self, name: str, start: float, duration: float, attrs: Dict[str, object]) -> None:
+        self.spans.append(Span(name, start - self.started, duration, attrs))
+
+
+class Metrics:
+    """
+    Process-wide counters, latency histograms and sampled gauges, rendered in the Prometheus text format.
+    Updated from the background loop and from Streamlit session threads, so every change holds the lock.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.buckets = buckets
+        self._counters: Dict[LabelKey, float] = {}
+        self._histograms: Dict[LabelKey, List[float]] = {}  # Bucket counts, then +Inf count and sum
+        self._gauges: Dict[LabelKey, Callable[[], float]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name: str, labels: Dict[str, str]) -> LabelKey:
+        return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        key = self._key(name, labels)
+        with self._lock:
+            counts = self._histograms.setdefault(key, [0.0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-2] += 1
+            counts[-1] += value
+
+    def gauge(self, name: str, sample: Callable[[], float], **labels: str) -> None:
+        """Register a gauge whose value is sampled each time the metrics are rendered."""
+        with self._lock:
+            self._gauges[self._key(name, labels)] = sample
+
+    def counter(self, name: str, **labels: str) -> float:
+        with self._lock:
+            return self._counters.get(self._key(name, labels), 0)
+
+    def render(self) -> str:
+        """Every metric in the Prometheus text exposition format."""
+        def label_text(labels: Tuple[Tuple[str, str], ...], extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+            pairs = [f'{label}="{value}"' for label, value in labels + extra]
+            return "{" + ",".join(pairs) + "}" if pairs else ""
+
+        lines = []
+        with self._lock:
+            gauges = sorted(self._gauges.items())
+        # Sampled outside the lock, so a sample may itself read or update metrics
+        sampled = [(key, sample()) for key, sample in gauges]
+        with self._lock:
+            typed = set()
+            for (name, labels), value in sorted(self._counters.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {name} counter")
+                    typed.add(name)
+                lines.append(f"{name}{label_text(labels)} {value:g}")
+            for (name, labels), counts in sorted(self._histograms.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {name} histogram")
+                    typed.add(name)
+                for bound, count in zip(self.buckets, counts):
+                    lines.append(f"{name}_bucket{label_text(labels, (('le', f'{bound:g}'),))} {count:g}")
+                lines.append(f"{name}_bucket{label_text(labels, (('le', '+Inf'),))} {counts[-2]:g}")
+                lines.append(f"{name}_count{label_text(labels)} {counts[-2]:g}")
+                lines.append(f"{name}_sum{label_text(labels)} {counts[-1]:g}")
+        for (name, labels), value in sampled:
+            if name not in typed:
+                lines.append(f"# TYPE {name} gauge")
+                typed.add(name)
+            lines.append(f"{name}{label_text(labels)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+# Trace of the search running in this context; None outside a traced search
+search_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("search_trace", default=None)
+
+
+# Function to record a finished span in the stage latency histogram and the current search's trace
+def record_span(name: str, start: float, duration: float, **attrs: object) -> None:
+    metrics.observe("pubmed_stage_seconds", duration, stage=name)
+    trace = search_trace.get()
+    if trace is not None:
+        trace.add(name, start, duration, attrs)
+
+
+# Function to time a block as a span; the yielded dict collects attributes shown in the waterfall
+@contextlib.contextmanager
+def span(name: str, **attrs: object) -> Iterator[Dict[str, object]]:
+    start = time.perf_counter()
+    try:
+        yield attrs
+    except BaseException as e:
+        attrs["error"] = type(e).__name__
+        raise
+    finally:
+        record_span(name, start, time.perf_counter() - start, **attrs)
+
+
+# Function to attribute spans recorded in this thread to a trace, for work done outside the background loop
+@contextlib.contextmanager
+def traced(trace: Optional[Trace]) -> Iterator[None]:
+    token = search_trace.set(trace)
+    try:
+        yield
+    finally:
+        search_trace.reset(token)
+
+
+# Function to serve the metrics at /metrics for Prometheus to scrape; runs on whichever loop awaits it
+async def serve_metrics(port: int, host: str = "0.0.0.0") -> web.AppRunner:
+    async def handle(request: web.Request) -> web.Response:
+        return web.Response(text=metrics.render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
@@ -0,0 +1,230 @@
+"""
+Local stand-ins for NCBI E-utilities and the OpenAI chat-completions API, for benchmarks.
+
+Point the pipeline at them with EUTILS_BASE_URL=http://127.0.0.1:<port> and an AsyncOpenAI
+client whose base_url is http://127.0.0.1:<port>/v1. Responses are reproducible for a given seed.
+"""
+import asyncio
+import json
+import random
+import re
+import time
+import zlib
+from typing import Dict, List, Optional
+from xml.sax.saxutils import escape
+
+from aiohttp import web
+
+JOURNALS = ("The Lancet", "JAMA", "BMJ (Clinical research ed.)", "The New England journal of medicine", "PloS one", "Scientific reports")
+PUBLICATION_TYPES = ("Journal Article", "Randomized Controlled Trial", "Review", "Systematic Review", "Meta-Analysis", "Observational Study")
+MESH_TERMS = ("Humans", "Aged", "Female", "Male", "Middle Aged", "Risk Factors", "Treatment Outcome", "Cardiovascular Diseases",
+              "Hydroxymethylglutaryl-CoA Reductase Inhibitors", "Diabetes Mellitus, Type 2", "Cohort Studies", "Prospective Studies")
+WORDS = (
+    "patients trial randomized cohort outcome risk mortality therapy dose placebo analysis efficacy safety "
+    "incidence adults children treatment association clinical controlled followup hospital primary secondary"
+).split()
+
+
+class MockEutils:
+    """
+    Fake ESearch/ESummary/EFetch. Each query gets its own stable PMID range, so different questions
+    miss each other's cache entries. Articles are replayed from a recorded EFetch fixture when one is
+    given (PMIDs rewritten), otherwise generated with abstracts of abstract_words words.
+    Requests are answered with 429 at random (throttle_rate) or, like NCBI, above max_rate per second.
+    """
+
+    def __init__(self, latency: float = 0.05, throttle_rate: float = 0.0, retry_after: Optional[float] = 1.0, abstract_words: int = 250,
+                 missing_abstract_rate: float = 0.1, total_count: int = 100000, fixture_path: Optional[str] = None, seed: int = 0,
+                 max_rate: Optional[float] = None, max_burst: int = 2) -> None:
+        self.latency = latency
+        self.throttle_rate = throttle_rate  # Share of requests answered with 429
+        self.retry_after = retry_after
+        # Token bucket; a burst of 2 absorbs the jitter between requests a client spaces exactly 1/max_rate apart
+        self.max_rate = max_rate
+        self.max_burst = max_burst
+        self._tokens = float(max_burst)
+        self._updated = time.monotonic()
+        self.abstract_words = abstract_words
+        self.missing_abstract_rate = missing_abstract_rate
+        self.total_count = total_count
+        self.seed = seed
+        self._random = random.Random(seed)
+        self.counts: Dict[str, int] = {"esearch": 0, "esummary": 0, "efetch": 0, "throttled": 0}
+        self.bytes_sent = 0
+        self.fixtures: List[str] = []
+        if fixture_path:
+            with open(fixture_path, "rb") as f:
+                xml_data = f.read()
+            # Keep each article's raw XML so replayed payloads have the recorded size and structure
+            blocks = re.findall(rb"<PubmedArticle>.*?</PubmedArticle>", xml_data, re.S)
+            self.fixtures = [block.decode() for block in blocks]
+            if not self.fixtures:
+                raise ValueError(f"No <PubmedArticle> elements in {fixture_path}")
+
+    def article_xml(self, pmid: str) -> str:
+        rng = random.Random(f"{self.seed}:{pmid}")
+        if self.fixtures:
+            template = self.fixtures[int(pmid) % len(self.fixtures)]
+            return re.sub(r"<PMID([^>]*)>\d+</PMID>", f"<PMID\\1>{pmid}</PMID>", template, count=1)
+        title = " ".join(rng.choices(WORDS, k=12)).capitalize()
+        abstract = ""
+        if rng.random() >= self.missing_abstract_rate:
+            text = " ".join(rng.choices(WORDS, k=self.abstract_words))
+            abstract = f"<Abstract><AbstractText Label=\"BACKGROUND\">{escape(text)}.</AbstractText></Abstract>"
+        authors = "".join(
+            f"<Author ValidYN=\"Y\"><LastName>{rng.choice(WORDS).capitalize()}</LastName><Initials>{rng.choice('ABCDEFGH')}</Initials></Author>"
+            for _ in range(rng.randint(1, 8))
+        )
+        publication_types = "".join(f"<PublicationType UI=\"D0\">{escape(pub_type)}</PublicationType>"
+                                    for pub_type in ["Journal Article", *rng.sample(PUBLICATION_TYPES[1:], rng.randint(0, 2))])
+        mesh = "".join(f"<MeshHeading><DescriptorName UI=\"D0\" MajorTopicYN=\"N\">{escape(term)}</DescriptorName></MeshHeading>"
+                       for term in rng.sample(MESH_TERMS, rng.randint(3, 8)))
+        return (
+            f"<PubmedArticle><MedlineCitation><PMID Version=\"1\">{pmid}</PMID><Article><Journal><JournalIssue>"
+            f"<PubDate><Year>{2015 + rng.randrange(10)}</Year></PubDate></JournalIssue><Title>{escape(rng.choice(JOURNALS))}</Title></Journal>"
+            f"<ArticleTitle>{escape(title)}.</ArticleTitle>{abstract}<AuthorList>{authors}</AuthorList>"
+            f"<PublicationTypeList>{publication_types}</PublicationTypeList><ELocationID EIdType=\"doi\" ValidYN=\"Y\">10.1000/{pmid}</ELocationID>"
+            f"</Article><MeshHeadingList>{mesh}</MeshHeadingList></MedlineCitation></PubmedArticle>"
+        )
+
+    def query_ids(self, term: str, retstart: int, retmax: int) -> List[str]:
+        base = 10000000 + zlib.crc32(term.encode()) % 89000 * 1000
+        return [str(base + i) for i in range(retstart, min(retstart + retmax, self.total_count))]
+
+    def _over_rate(self) -> bool:
+        if not self.max_rate:
+            return False
+        now = time.monotonic()
+        self._tokens = min(self.max_burst, self._tokens + (now - self._updated) * self.max_rate)
+        self._updated = now
+        if self._tokens < 1:
+            return True
+        self._tokens -= 1
+        return False
+
+    async def _respond(self, request: web.Request, endpoint: str) -> Optional[web.Response]:
+        self.counts[endpoint] += 1
+        # The rate is checked on arrival, as NCBI counts requests when they come in
+        over_rate = self._over_rate()
+        await asyncio.sleep(self.latency)
+        if over_rate or (self.throttle_rate and self._random.random() < self.throttle_rate):
+            self.counts["throttled"] += 1
+            headers = {"Retry-After": f"{self.retry_after:g}"} if self.retry_after is not None else {}
+            return web.json_response({"error": "API rate limit exceeded"}, status=429, headers=headers)
+        return None
+
+    @staticmethod
+    async def _params(request: web.Request) -> Dict[str, str]:
+        params = dict(request.query)
+        if request.method == "POST":
+            params.update(await request.post())
+        return params
+
+    def _send(self, response: web.Response) -> web.Response:
+        self.bytes_sent += len(response.body)
+        return response
+
+    async def esearch(self, request: web.Request) -> web.Response:
+        throttled = await self._respond(request, "esearch")
+        if throttled is not None:
+            return throttled
+        params = await self._params(request)
+        ids = self.query_ids(params.get("term", ""), int(params.get("retstart", 0)), int(params.get("retmax", 20)))
+        return self._send(web.json_response({"esearchresult": {"count": str(self.total_count), "idlist": ids}}))
+
+    async def esummary(self, request: web.Request) -> web.Response:
+        throttled = await self._respond(request, "esummary")
+        if throttled is not None:
+            return throttled
+        ids = (await self._params(request))["id"].split(",")
+        result = {"uids": ids}
+        for id in ids:
+            result[id] = {"uid": id, "title": f"Title {id}", "pubdate": "2023 Jan 5", "source": "Journal of Tests"}
+        return self._send(web.json_response({"result": result}))
+
+    async def efetch(self, request: web.Request) -> web.Response:
+        throttled = await self._respond(request, "efetch")
+        if throttled is not None:
+            return throttled
+        ids = (await self._params(request))["id"].split(",")
+        body = "<?xml version=\"1.0\"?><PubmedArticleSet>" + "".join(self.article_xml(id) for id in ids) + "</PubmedArticleSet>"
+        return self._send(web.Response(text=body, content_type="text/xml"))
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        for endpoint in ("esearch", "esummary", "efetch"):
+            app.router.add_route("*", f"/{endpoint}.fcgi", getattr(self, endpoint))
+        return app
+
+
+class MockChatCompletions:
+    """
+    Fake /v1/chat/completions that streams a canned PubMed query one word per token_delay, with usage.
+    "{question}" in the reply is replaced by the user message, so each question gets its own search.
+    JSON-mode requests get a {pmid: summary} object for every "PMID <number>:" line in the user message.
+    """
+
+    REPLY = '("hydroxymethylglutaryl-coa reductase inhibitors"[MeSH Terms] OR statin*[tiab]) AND ({question}[tiab])'
+
+    def __init__(self, token_delay: float = 0.02, first_token_delay: float = 0.2, reply: str = REPLY, summary_words: int = 30) -> None:
+        self.token_delay = token_delay
+        self.first_token_delay = first_token_delay
+        self.reply = reply
+        self.summary_words = summary_words
+        self.in_flight = 0
+        self.counts: Dict[str, int] = {"requests": 0, "completed": 0, "cancelled": 0, "max_in_flight": 0}
+
+    def _chunk(self, model: str, **fields) -> bytes:
+        return f"data: {json.dumps({'id': 'mock', 'object': 'chat.completion.chunk', 'created': 0, 'model': model, **fields})}\n\n".encode()
+
+    async def chat(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        self.counts["requests"] += 1
+        if body.get("response_format", {}).get("type") == "json_object":
+            filler = " ".join(["finding"] * (self.summary_words - 6))
+            reply = json.dumps({pmid: f"Mock summary of PMID {pmid}: {filler}." for pmid in re.findall(r"^PMID (\d+):", body["messages"][-1]["content"], re.M)})
+        else:
+            reply = self.reply.replace("{question}", body["messages"][-1]["content"])
+        words = [f"{word} " for word in reply.split(" ")]
+        prompt_tokens = sum(len(message["content"].split()) for message in body["messages"])
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(words), "total_tokens": prompt_tokens + len(words)}
+        if not body.get("stream"):
+            self.in_flight += 1
+            self.counts["max_in_flight"] = max(self.counts["max_in_flight"], self.in_flight)
+            try:
+                await asyncio.sleep(self.first_token_delay + self.token_delay * len(words))
+            finally:
+                self.in_flight -= 1
+            self.counts["completed"] += 1
+            return web.json_response({
+                "id": "mock", "object": "chat.completion", "created": 0, "model": body["model"], "usage": usage,
+                "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": reply}}],
+            })
+
+        await asyncio.sleep(self.first_token_delay)
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        try:
+            for word in words:
+                await response.write(self._chunk(body["model"], choices=[{"index": 0, "delta": {"content": word}, "finish_reason": None}]))
+                await asyncio.sleep(self.token_delay)
+            await response.write(self._chunk(body["model"], choices=[], usage=usage) + b"data: [DONE]\n\n")
+        except (asyncio.CancelledError, ConnectionResetError):
+            self.counts["cancelled"] += 1
+            raise
+        self.counts["completed"] += 1
+        return response
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.chat)
+        return app
+
+
+# Function to serve a mock app on a local port until the returned runner is cleaned up
+async def start_server(app: web.Application, port: int, host: str = "127.0.0.1") -> web.AppRunner:
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
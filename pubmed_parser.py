@@ -0,0 +1,133 @@
+import xml.etree.ElementTree as ET
+from typing import Iterator, List, NamedTuple, Optional, Tuple, Union
+
+
+class ArticleRecord(NamedTuple):
+    pmid: str
+    title: str
+    year: str
+    abstract: str
+    sections: List[Tuple[str, str]]  # (label, text) pairs of a structured abstract
+    journal: str = ""
+    doi: str = ""
+    authors: Tuple[str, ...] = ()  # "Lastname Initials", or a collective name
+    publication_types: Tuple[str, ...] = ()
+    mesh_terms: Tuple[str, ...] = ()  # MeSH descriptor names, without qualifiers
+
+
+# Function to join the text of an element and all of its descendants (titles and abstracts may contain <i>, <sup>, ...)
+def element_text(elem: Optional[ET.Element]) -> str:
+    if elem is None:
+        return ""
+    return "".join(elem.itertext()).strip()
+
+
+# Function to find the publication year of an article, falling back from the journal issue to the electronic date
+def article_year(article: ET.Element) -> str:
+    pub_date = article.find("Journal/JournalIssue/PubDate")
+    if pub_date is not None:
+        year = pub_date.findtext("Year")
+        if year:
+            return year.strip()
+        medline_date = pub_date.findtext("MedlineDate")
+        if medline_date:
+            return medline_date.strip()[:4]
+    return (article.findtext("ArticleDate/Year") or "").strip()
+
+
+# Function to list an article's authors as "Lastname Initials", keeping collective (group) authors by name
+def article_authors(article: ET.Element) -> Tuple[str, ...]:
+    authors = []
+    for author in article.findall("AuthorList/Author"):
+        last_name = author.findtext("LastName")
+        if last_name:
+            initials = author.findtext("Initials")
+            authors.append(f"{last_name} {initials}" if initials else last_name)
+        else:
+            collective = element_text(author.find("CollectiveName"))
+            if collective:
+                authors.append(collective)
+    return tuple(authors)
+
+
+# Function to find an article's DOI, preferring the publisher's ELocationID over PubmedData's ID list
+def article_doi(elem: ET.Element, article: ET.Element) -> str:
+    for location in article.findall("ELocationID"):
+        if location.get("EIdType") == "doi" and location.text:
+            return location.text.strip()
+    for article_id in elem.findall("PubmedData/ArticleIdList/ArticleId"):
+        if article_id.get("IdType") == "doi" and article_id.text:
+            return article_id.text.strip()
+    return ""
+
+
+# Function to turn one <PubmedArticle> element into an ArticleRecord
+def parse_pubmed_article(elem: ET.Element) -> ArticleRecord:
+    citation = elem.find("MedlineCitation")
+    if citation is None:
+        return ArticleRecord("", "", "", "", [])
+    pmid = (citation.findtext("PMID") or "").strip()
+    article = citation.find("Article")
+    if article is None:
+        return ArticleRecord(pmid, "", "", "", [])
+
+    sections = []
+    for abstract_text in article.findall("Abstract/AbstractText"):
+        sections.append((abstract_text.get("Label") or "", element_text(abstract_text)))
+    abstract = " ".join(f"{label}: {text}" if label else text for label, text in sections).strip()
+
+    mesh_terms = tuple(element_text(descriptor) for descriptor in citation.iterfind("MeshHeadingList/MeshHeading/DescriptorName"))
+    publication_types = tuple(element_text(pub_type) for pub_type in article.iterfind("PublicationTypeList/PublicationType"))
+
+    return ArticleRecord(
+        pmid, element_text(article.find("ArticleTitle")), article_year(article), abstract, sections,
+        journal=element_text(article.find("Journal/Title")) or element_text(article.find("Journal/ISOAbbreviation")),
+        doi=article_doi(elem, article),
+        authors=article_authors(article),
+        publication_types=publication_types,
+        mesh_terms=mesh_terms,
+    )
+
+
+class PubmedArticleParser:
+    """
+    Incremental parser for EFetch PubmedArticleSet XML.
+    Feed it bytes as they arrive and it yields an ArticleRecord for each completed
+    <PubmedArticle>, discarding the parsed elements so memory stays flat.
+    """
+
+    def __init__(self) -> None:
+        self._parser = ET.XMLPullParser(events=("start", "end"))
+        self._root = None
+
+    def feed(self, data: bytes) -> Iterator[ArticleRecord]:
+        self._parser.feed(data)
+        yield from self._read_events()
+
+    def close(self) -> Iterator[ArticleRecord]:
+        self._parser.close()
+        yield from self._read_events()
+
+    def _read_events(self) -> Iterator[ArticleRecord]:
+        for event, elem in self._parser.read_events():
+            if event == "start":
+                if self._root is None:
+                    self._root = elem
+            elif elem.tag == "PubmedArticle":
+                yield parse_pubmed_article(elem)
+                elem.clear()
+                # Drop finished articles from the root so the tree never grows with the payload
+                self._root.clear()
+            elif elem.tag == "PubmedBookArticle":
+                elem.clear()
+                self._root.clear()
+
+
+# Function to parse a complete EFetch XML document into ArticleRecords
+def iter_pubmed_articles(xml_data: Union[bytes, str], chunk_size: int = 64 * 1024) -> Iterator[ArticleRecord]:
+    if isinstance(xml_data, str):
+        xml_data = xml_data.encode("utf-8")
+    parser = PubmedArticleParser()
+    for i in range(0, len(xml_data), chunk_size):
+        yield from parser.feed(xml_data[i:i + chunk_size])
+    yield from parser.close()
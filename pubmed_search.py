@@ -0,0 +1,594 @@
+import aiohttp
+import asyncio
+import contextlib
+import contextvars
+import math
+import os
+import time
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+from openai import AsyncOpenAI
+from prompts import main_pubmed_prompt, clinical_trials_prompt, review_type_prompt
+from pubmed_parser import ArticleRecord, PubmedArticleParser, iter_pubmed_articles
+from article_cache import ArticleCache
+from rate_limiter import RateLimiter, parse_retry_after
+from query_cache import QueryCache
+from summary_cache import SummaryCache
+from metrics import metrics, record_span, span
+import xml.etree.ElementTree as ET
+
+EUTILS_BASE_URL = os.environ.get("EUTILS_BASE_URL", "https://eutils.ncbi.nlm.nih.gov/entrez/eutils")
+FETCH_BATCH_SIZE = 200  # PMIDs per ESummary/EFetch request
+MAX_TOPUP_ROUNDS = 5  # Extra ESearch pages to try when articles are dropped for missing abstracts
+MAX_TOPUP_PAGE = 500
+RRF_K = 60  # Reciprocal-rank fusion constant; damps the advantage of the very top ranks
+
+SEARCH_STRATEGIES = {
+    'general use': main_pubmed_prompt,
+    'relevant clinical trials': clinical_trials_prompt,
+    'review types of articles': review_type_prompt,
+}
+
+# Messages raised while a search runs on the background loop, where st.* calls would not reach the page
+search_notices: contextvars.ContextVar[Optional[List[Tuple[str, str]]]] = contextvars.ContextVar("search_notices", default=None)
+# Streamlit session a search runs for, so the rate limiter can queue users fairly
+search_client: contextvars.ContextVar[str] = contextvars.ContextVar("search_client", default="default")
+
+
+# Function to report a message to the session that started the current search
+def notify(level: str, message: str) -> None:
+    if level == "error":
+        metrics.inc("pubmed_search_errors_total")
+    notices = search_notices.get()
+    if notices is None:
+        print(message)
+    else:
+        notices.append((level, message))
+
+
+# Shared clients and caches; the Streamlit app and the batch runner each configure them once per process
+_resources: Dict[str, Any] = {}
+
+
+# Function to install shared clients, caches and settings; anything left as None keeps its default
+def configure(pubmed_api_key: Optional[str] = None, article_cache: Optional[ArticleCache] = None, query_cache: Optional[QueryCache] = None,
+              rate_limiter: Optional[RateLimiter] = None, openai_client: Optional[AsyncOpenAI] = None, summary_cache: Optional[SummaryCache] = None) -> None:
+    settings = {
+        "pubmed_api_key": pubmed_api_key,
+        "article_cache": article_cache,
+        "query_cache": query_cache,
+        "summary_cache": summary_cache,
+        "rate_limiter": rate_limiter,
+        "openai_client": openai_client,
+    }
+    _resources.update({name: value for name, value in settings.items() if value is not None})
+
+
+# Function to get the NCBI API key
+def get_pubmed_api_key() -> str:
+    return _resources.setdefault("pubmed_api_key", os.environ.get("NCBI_API_KEY", ""))
+
+
+# Function to get the article cache
+def get_article_cache() -> ArticleCache:
+    if "article_cache" not in _resources:
+        _resources["article_cache"] = ArticleCache()
+    return _resources["article_cache"]
+
+
+# Function to get the optimized-query cache
+def get_query_cache() -> QueryCache:
+    if "query_cache" not in _resources:
+        _resources["query_cache"] = QueryCache(similarity_threshold=0.9)
+    return _resources["query_cache"]
+
+
+# Function to get the per-article summary cache
+def get_summary_cache() -> SummaryCache:
+    if "summary_cache" not in _resources:
+        _resources["summary_cache"] = SummaryCache()
+    return _resources["summary_cache"]
+
+
+# Function to get the NCBI rate limiter; it must only be used from one event loop
+def get_rate_limiter() -> RateLimiter:
+    if "rate_limiter" not in _resources:
+        # NCBI allows 10 requests/second with an API key and 3 without
+        _resources["rate_limiter"] = RateLimiter(rate=10 if get_pubmed_api_key() else 3)
+    return _resources["rate_limiter"]
+
+
+# Function to read one of the NCBI rate limiter's stats for a gauge; zero until a limiter exists
+def rate_limiter_stat(name: str) -> float:
+    limiter = _resources.get("rate_limiter")
+    return limiter.stats()[name] if limiter else 0
+
+
+# The limiter's backlog, sampled whenever the metrics are scraped
+metrics.gauge("pubmed_rate_limiter_queue_depth", lambda: rate_limiter_stat("queue_depth"))
+metrics.gauge("pubmed_rate_limiter_waiting_clients", lambda: rate_limiter_stat("waiting_clients"))
+
+
+# Function to get the OpenAI client; it must only be used from one event loop
+def get_async_openai_client() -> AsyncOpenAI:
+    if "openai_client" not in _resources:
+        _resources["openai_client"] = AsyncOpenAI()
+    return _resources["openai_client"]
+
+
+# Function to build the request parameters for a chat completion
+def chat_completion_params(
+    messages,
+    model="gpt-4o",
+    frequency_penalty=0,
+    logit_bias=None,
+    logprobs=False,
+    top_logprobs=None,
+    max_tokens=None,
+    n=1,
+    presence_penalty=0,
+    response_format=None,
+    seed=42,  # Adding seed for reproducibility
+    stop=None,
+    stream=False,
+    include_usage=False,
+    temperature=1,
+    top_p=1,
+    tools=None,
+    tool_choice="none",
+    user=None
+):
+    params = {
+        "model": model,
+        "messages": messages,
+        "frequency_penalty": frequency_penalty,
+        "logit_bias": logit_bias,
+        "logprobs": logprobs,
+        "top_logprobs": top_logprobs,
+        "max_tokens": max_tokens,
+        "n": n,
+        "presence_penalty": presence_penalty,
+        "response_format": response_format,
+        "seed": seed,
+        "stop": stop,
+        "stream": stream,
+        "temperature": temperature,
+        "top_p": top_p,
+        "user": user
+    }
+
+    if stream:
+        params["stream_options"] = {"include_usage": include_usage}
+    else:
+        params.pop("stream_options", None)
+
+    if tools:
+        params["tools"] = [{"type": "function", "function": tool} for tool in tools]
+        params["tool_choice"] = tool_choice
+
+    if response_format == "json_object":
+        params["response_format"] = {"type": "json_object"}
+    elif response_format == "text":
+        params["response_format"] = {"type": "text"}
+    else:
+        params.pop("response_format", None)
+
+    return {k: v for k, v in params.items() if v is not None}
+
+# Function to create a chat completion and return its text; usage and latency are written into stats
+async def create_chat_completion(messages, stats: Optional[Dict] = None, **kwargs) -> str:
+    if stats is None:
+        stats = {}
+    client = get_async_openai_client()
+    params = chat_completion_params(messages, **kwargs)
+    start = time.perf_counter()
+    with span("llm", model=params["model"]) as attrs:
+        completion = await client.chat.completions.create(**params)
+        stats["total_seconds"] = time.perf_counter() - start
+        if completion.usage:
+            stats["prompt_tokens"] = completion.usage.prompt_tokens
+            stats["completion_tokens"] = completion.usage.completion_tokens
+            metrics.inc("llm_tokens_total", completion.usage.prompt_tokens, model=params["model"], kind="prompt")
+            metrics.inc("llm_tokens_total", completion.usage.completion_tokens, model=params["model"], kind="completion")
+        attrs.update({name: stats[name] for name in ("prompt_tokens", "completion_tokens") if name in stats})
+    metrics.inc("llm_requests_total", model=params["model"])
+    return completion.choices[0].message.content or ""
+
+# Function to stream a chat completion, yielding the text so far; usage and latency are written into stats when it finishes
+async def stream_chat_completion(messages, stats: Optional[Dict] = None, **kwargs) -> AsyncIterator[str]:
+    client = get_async_openai_client()
+    params = chat_completion_params(messages, stream=True, include_usage=True, **kwargs)
+    if stats is None:
+        stats = {}
+    start = time.perf_counter()
+    text = ""
+    with span("llm", model=params["model"]) as attrs:
+        stream = await client.chat.completions.create(**params)
+        # Leaving the block (including on cancellation) closes the HTTP response
+        async with stream:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if not text:
+                        stats["first_token_seconds"] = time.perf_counter() - start
+                        metrics.observe("llm_first_token_seconds", stats["first_token_seconds"], model=params["model"])
+                    text += chunk.choices[0].delta.content
+                    yield text
+                if chunk.usage:
+                    stats["prompt_tokens"] = chunk.usage.prompt_tokens
+                    stats["completion_tokens"] = chunk.usage.completion_tokens
+                    metrics.inc("llm_tokens_total", chunk.usage.prompt_tokens, model=params["model"], kind="prompt")
+                    metrics.inc("llm_tokens_total", chunk.usage.completion_tokens, model=params["model"], kind="completion")
+        stats["total_seconds"] = time.perf_counter() - start
+        attrs.update({name: stats[name] for name in ("first_token_seconds", "prompt_tokens", "completion_tokens") if name in stats})
+    metrics.inc("llm_requests_total", model=params["model"])
+
+# Function to stream an EFetch response through the incremental parser as the bytes arrive
+async def stream_article_records(response: aiohttp.ClientResponse, on_record: Optional[Callable[[ArticleRecord], None]] = None) -> Dict[str, ArticleRecord]:
+    parser = PubmedArticleParser()
+    records = {}
+    # Parsing interleaves with the download, so only the time spent inside the parser is counted
+    first_chunk = None
+    parse_seconds = 0.0
+    async for chunk in response.content.iter_chunked(64 * 1024):
+        started = time.perf_counter()
+        first_chunk = first_chunk or started
+        # feed() is lazy; the parsing happens while its records are drawn, so draw them inside the timed region
+        parsed = list(parser.feed(chunk))
+        parse_seconds += time.perf_counter() - started
+        for record in parsed:
+            records[record.pmid] = record
+            if on_record:
+                on_record(record)
+    started = time.perf_counter()
+    parsed = list(parser.close())
+    parse_seconds += time.perf_counter() - started
+    for record in parsed:
+        records[record.pmid] = record
+        if on_record:
+            on_record(record)
+    record_span("parse", first_chunk or started, parse_seconds, articles=len(records))
+    return records
+
+
+# Function to send one E-utilities request through the shared rate limiter, retrying 429s
+@contextlib.asynccontextmanager
+async def eutils_request(session: aiohttp.ClientSession, url: str, data: Optional[Dict] = None, max_attempts: int = 4):
+    limiter = get_rate_limiter()
+    endpoint = url.rsplit("/", 1)[-1].split(".")[0]
+    with span(endpoint) as attrs:
+        for attempt in range(max_attempts):
+            attrs["queued_seconds"] = attrs.get("queued_seconds", 0.0) + await limiter.acquire(search_client.get())
+            response = await session.request("POST" if data else "GET", url, data=data)
+            metrics.inc("pubmed_eutils_requests_total", endpoint=endpoint, status=str(response.status))
+            if response.status == 429 and attempt < max_attempts - 1:
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                response.release()
+                limiter.penalize(retry_after)
+                metrics.inc("pubmed_eutils_retries_total", endpoint=endpoint)
+                attrs["retries"] = attempt + 1
+                with span("backoff", endpoint=endpoint):
+                    await asyncio.sleep(limiter.backoff(attempt, retry_after))
+                continue
+            attrs["status"] = response.status
+            try:
+                response.raise_for_status()
+                yield response
+            finally:
+                attrs["bytes"] = response.content.total_bytes
+                metrics.inc("pubmed_eutils_response_bytes_total", response.content.total_bytes, endpoint=endpoint)
+                metrics.observe("pubmed_rate_limit_wait_seconds", attrs["queued_seconds"])
+                response.release()
+            return
+
+
+# Function to fetch titles, years and abstracts for a batch of PMIDs with retry logic
+async def fetch_article_details(session: aiohttp.ClientSession, ids: List[str], use_esummary: bool = False, on_record: Optional[Callable[[ArticleRecord], None]] = None) -> Tuple[List[str], Dict[str, ArticleRecord]]:
+    # Only PMIDs missing from the cache go to NCBI
+    cache = get_article_cache()
+    cached = cache.get_many(ids)
+    metrics.inc("pubmed_article_cache_hits_total", len(cached))
+    metrics.inc("pubmed_article_cache_misses_total", len(ids) - len(cached))
+    if on_record:
+        for record in cached.values():
+            on_record(record)
+    missing = [id for id in ids if id not in cached]
+    if not missing:
+        return ids, cached
+
+    # POST keeps long comma-joined ID lists out of the URL, as NCBI recommends for more than ~200 IDs
+    params = {"db": "pubmed", "id": ",".join(missing), "api_key": get_pubmed_api_key()}
+    for attempt in range(3):  # Retry up to 3 times on errors that outlast the 429 retries in eutils_request
+        try:
+            async with eutils_request(session, f"{EUTILS_BASE_URL}/efetch.fcgi", data={**params, "retmode": "xml", "rettype": "abstract"}) as abstracts_response:
+                # With ESummary the records are only final once its titles and years are merged in
+                records = await stream_article_records(abstracts_response, None if use_esummary else on_record)
+
+            # EFetch already carries title and year; ESummary is only needed to prefer its formatting
+            if use_esummary:
+                async with eutils_request(session, f"{EUTILS_BASE_URL}/esummary.fcgi", data={**params, "retmode": "json"}) as details_response:
+                    details_data = await details_response.json()
+                for id, record in records.items():
+                    summary = details_data.get('result', {}).get(id)
+                    if summary:
+                        records[id] = record._replace(title=summary['title'], year=summary['pubdate'].split(" ")[0])
+                if on_record:
+                    for record in records.values():
+                        on_record(record)
+
+            if records:
+                cache.put_many(records.values())
+                return ids, {**cached, **records}
+            else:
+                notify("error", f"No details found for IDs {', '.join(missing)}, attempt {attempt + 1}")
+
+        except aiohttp.ClientResponseError as e:
+            if e.status == 429:  # Still rate limited after eutils_request's own retries
+                await asyncio.sleep(get_rate_limiter().backoff(attempt))
+            else:
+                notify("error", f"ClientResponseError for IDs {', '.join(missing)}: {e}")
+                raise
+        except Exception as e:
+            if attempt == 2:
+                notify("error", f"Error fetching details for IDs {', '.join(missing)}: {e}")
+                return ids, cached
+            else:
+                await asyncio.sleep(get_rate_limiter().backoff(attempt))  # Jittered backoff on general errors
+
+    return ids, cached
+
+
+# Function to fetch details for any number of PMIDs in batched requests, yielding each record as soon as it is parsed
+async def stream_articles_batched(session: aiohttp.ClientSession, ids: List[str], batch_size: int = FETCH_BATCH_SIZE) -> AsyncIterator[Tuple[str, Optional[ArticleRecord]]]:
+    # Batches report records, then their ID list once finished (so PMIDs NCBI never returned resolve to None), or an exception
+    queue = asyncio.Queue()
+
+    async def fetch(batch: List[str]) -> None:
+        try:
+            await fetch_article_details(session, batch, on_record=queue.put_nowait)
+            queue.put_nowait(batch)
+        except Exception as e:
+            queue.put_nowait(e)
+
+    batches = [ids[i:i + batch_size] for i in range(0, len(ids), batch_size)]
+    tasks = [asyncio.create_task(fetch(batch)) for batch in batches]
+    resolved = set()
+    try:
+        for _ in batches:
+            item = await queue.get()
+            while isinstance(item, ArticleRecord):
+                if item.pmid not in resolved:
+                    resolved.add(item.pmid)
+                    yield item.pmid, item
+                item = await queue.get()
+            if isinstance(item, Exception):
+                raise item
+            for id in item:
+                if id not in resolved:
+                    resolved.add(id)
+                    yield id, None
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+# Function to extract abstract from XML
+async def extract_abstract_from_xml(xml_data: str, pmid: str) -> str:
+    try:
+        with span("parse", pmid=pmid):
+            for record in iter_pubmed_articles(xml_data):
+                if record.pmid == pmid:
+                    return record.abstract or "No abstract available"
+            return "No abstract available"
+    except ET.ParseError as e:
+        notify("error", f"Error parsing XML for PMID {pmid}: {e}")
+        return "Error extracting abstract"
+
+
+# Function to add the publication-date window and optional human-studies filter to a search
+def build_search_query(search_terms: str, years_back: int = 3, human_only: bool = False) -> str:
+    current_year = datetime.now().year
+    start_year = current_year - years_back
+    human_filter = "+AND+humans[MeSH+Terms]" if human_only else ""
+    return f"{search_terms}+AND+{start_year}[PDAT]:{current_year}[PDAT]{human_filter}"
+
+# Function to run an ESearch, answering repeats of the same query from the cache; mindate limits it to records added since then
+async def esearch(session: aiohttp.ClientSession, search_query: str, retmax: int, retstart: int = 0, mindate: Optional[str] = None) -> Dict:
+    query = f"term={search_query}&sort=relevance&retstart={retstart}&retmax={retmax}"
+    if mindate:
+        # EDAT is when the record entered PubMed, so articles published earlier but indexed late still count as new
+        query += f"&datetype=edat&mindate={mindate}&maxdate={datetime.now():%Y/%m/%d}"
+    cache = get_article_cache()
+    result = cache.get_search(query)
+    metrics.inc("pubmed_search_cache_lookups_total", result="miss" if result is None else "hit")
+    if result is None:
+        url = f"{EUTILS_BASE_URL}/esearch.fcgi?db=pubmed&{query}&retmode=json&api_key={get_pubmed_api_key()}"
+        async with eutils_request(session, url) as response:
+            data = await response.json()
+        result = data.get('esearchresult', {})
+        if 'count' in result:
+            cache.put_search(query, result)
+    return result
+
+# Function to size the next top-up page from the share of fetched articles that had an abstract
+def topup_page_size(needed: int, fetched: int, kept: int) -> int:
+    keep_rate = max(kept / fetched, 0.1) if fetched else 1.0
+    # Over-fetch by 25% so one extra round usually reaches the target
+    return min(MAX_TOPUP_PAGE, math.ceil(needed / keep_rate * 1.25))
+
+# Function to fetch the next page of results, skipping PMIDs that were already seen
+async def fetch_additional_results(session: aiohttp.ClientSession, search_query: str, retstart: int, retmax: int, seen: set) -> Tuple[List[str], bool]:
+    try:
+        result = await esearch(session, search_query, retmax, retstart)
+        page = result.get('idlist', [])
+        new_ids = [id for id in page if id not in seen]
+        seen.update(new_ids)
+        return new_ids, bool(page)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        notify("error", f"Error fetching additional results: {e}")
+        return [], False
+
+# Function to turn an EFetch record into an article dict, or None if it lacks a year or an abstract
+def article_from_record(id: str, record: Optional[ArticleRecord]) -> Optional[Dict[str, str]]:
+    if record is None:
+        notify("error", f"Details not available for ID {id}.")
+        return None
+    if not (record.year.isdigit() and record.abstract):
+        return None
+    return {
+        'pmid': id,
+        'title': record.title,
+        'year': record.year,
+        'link': f"https://pubmed.ncbi.nlm.nih.gov/{id}",
+        'abstract': record.abstract,
+        'journal': record.journal,
+        'doi': record.doi,
+        'authors': list(record.authors),
+        'publication_types': list(record.publication_types),
+        'mesh_terms': list(record.mesh_terms),
+    }
+
+# Function to pick which resolved articles are certain to be in the top max_results, in relevance order
+def releasable_ranks(outcomes: Dict[int, Optional[Dict[str, str]]], total_ranks: int, max_results: int, released: set) -> List[int]:
+    ready = []
+    candidates = 0  # Articles ranked higher that are kept or still unresolved
+    for rank in range(total_ranks):
+        if candidates >= max_results:
+            break
+        if rank in outcomes and outcomes[rank] is None:
+            continue
+        if rank in outcomes and rank not in released:
+            ready.append(rank)
+            released.add(rank)
+        candidates += 1
+    return ready
+
+# Function to stream PubMed abstracts as (relevance rank, article) pairs, each as soon as it is known to be in the results
+# A failure is reported through notify and, when stats is given, as stats["error"] so callers can tell it from an empty result.
+async def pubmed_abstracts_stream(search_terms: str, search_type: str = "all", max_results: int = 5, years_back: int = 3, human_only: bool = False, batch_size: int = FETCH_BATCH_SIZE, session: Optional[aiohttp.ClientSession] = None,
+                                  stats: Optional[Dict] = None) -> AsyncIterator[Tuple[int, Dict[str, str]]]:
+    if stats is None:
+        stats = {}
+    if session is None:
+        async with aiohttp.ClientSession() as session:
+            async for item in pubmed_abstracts_stream(search_terms, search_type, max_results, years_back, human_only, batch_size, session, stats):
+                yield item
+        return
+
+    search_query = build_search_query(search_terms, years_back, human_only)
+
+    try:
+        result = await esearch(session, search_query, max_results)
+        if 'count' not in result:
+            stats["error"] = "Unexpected response format from PubMed API"
+            notify("error", stats["error"])
+            return
+        if int(result['count']) == 0:
+            notify("write", "No PubMed results found within the time period. Expand time range in settings or try a different question.")
+            return
+
+        ids = result.get('idlist', [])
+        if not ids:
+            notify("write", "No results found.")
+            return
+
+        ranks = {}  # PMID -> position in the ESearch relevance order
+        outcomes = {}  # rank -> article, or None if dropped
+        released = set()
+        seen = set()
+        retstart = 0
+        kept = 0
+        for page in range(MAX_TOPUP_ROUNDS + 1):
+            if page > 0:
+                # Page past everything already fetched; the observed abstract-missing rate sizes each page
+                if kept >= max_results or retstart >= int(result['count']):
+                    break
+                retmax = topup_page_size(max_results - kept, len(outcomes), kept)
+                ids, more = await fetch_additional_results(session, search_query, retstart, retmax, seen)
+                retstart += retmax
+                if not more:
+                    break
+            else:
+                seen.update(ids)
+                retstart = len(ids)
+
+            for id in ids:
+                ranks[id] = len(ranks)
+            async for id, record in stream_articles_batched(session, ids, batch_size):
+                article = article_from_record(id, record)
+                outcomes[ranks[id]] = article
+                if article is not None:
+                    kept += 1
+                for rank in releasable_ranks(outcomes, len(ranks), max_results, released):
+                    yield rank, outcomes[rank]
+
+    except aiohttp.ClientError as e:
+        stats["error"] = f"Error connecting to PubMed API: {e}"
+        notify("error", stats["error"])
+    except Exception as e:
+        stats["error"] = f"An unexpected error occurred: {e}"
+        notify("error", stats["error"])
+
+# Function to fetch PubMed abstracts
+async def pubmed_abstracts(search_terms: str, search_type: str = "all", max_results: int = 5, years_back: int = 3, human_only: bool = False, batch_size: int = FETCH_BATCH_SIZE, session: Optional[aiohttp.ClientSession] = None,
+                           stats: Optional[Dict] = None) -> Tuple[List[Dict[str, str]], List[str]]:
+    ranked = [item async for item in pubmed_abstracts_stream(search_terms, search_type, max_results, years_back, human_only, batch_size, session, stats)]
+    articles = [article for _, article in sorted(ranked, key=lambda item: item[0])]
+    return articles, [article['link'] for article in articles]
+
+# Function to stream the optimized query from GPT-4o, yielding the search terms so far
+async def optimize_query_stream(system_prompt=main_pubmed_prompt, search_terms=None, stats: Optional[Dict] = None) -> AsyncIterator[str]:
+    if stats is None:
+        stats = {}
+    cache = get_query_cache()
+    cached = cache.get(system_prompt, search_terms)
+    metrics.inc("llm_query_cache_lookups_total", result=cached[1] if cached else "miss")
+    if cached:
+        optimized_query, stats["cache"] = cached
+        yield optimized_query
+        return
+
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": search_terms}
+    ]
+    text = ""
+    async for text in stream_chat_completion(messages, stats=stats):
+        yield text
+    if text.strip():
+        cache.put(system_prompt, search_terms, text.strip(), stats.get("total_seconds", 0.0))
+
+# Function to optimize the query using GPT-4o
+async def optimize_query(system_prompt=main_pubmed_prompt, search_terms=None, stats: Optional[Dict] = None):
+    optimized_query = ""
+    async for optimized_query in optimize_query_stream(system_prompt, search_terms, stats):
+        pass
+    return optimized_query.strip()
+
+# Function to merge ranked article lists with reciprocal-rank fusion, recording which strategies found each article
+def reciprocal_rank_fusion(ranked_lists: Dict[str, List[Dict[str, str]]], k: int = RRF_K) -> List[Dict]:
+    scores = {}
+    merged = {}
+    for strategy, articles in ranked_lists.items():
+        for rank, article in enumerate(articles):
+            link = article['link']
+            scores[link] = scores.get(link, 0.0) + 1.0 / (k + rank + 1)
+            merged.setdefault(link, {**article, 'strategies': []})['strategies'].append(strategy)
+    return [merged[link] for link in sorted(scores, key=scores.get, reverse=True)]
+
+# Function to run every search strategy concurrently, from query optimization through retrieval.
+# A strategy that fails is reported through notify and left out, so the others' results are still fused.
+async def multi_strategy_search(question: str, search_type: str = "all", max_results: int = 5, years_back: int = 3, human_only: bool = False, session: Optional[aiohttp.ClientSession] = None) -> Tuple[List[Dict], Dict[str, str]]:
+    async def run_strategy(system_prompt: str) -> Tuple[str, List[Dict[str, str]]]:
+        optimized_query = await optimize_query(system_prompt=system_prompt, search_terms=question)
+        articles, _ = await pubmed_abstracts(optimized_query, search_type, max_results, years_back, human_only, session=session)
+        return optimized_query, articles
+
+    results = await asyncio.gather(*(run_strategy(prompt) for prompt in SEARCH_STRATEGIES.values()), return_exceptions=True)
+    queries = {}
+    ranked_lists = {}
+    for strategy, result in zip(SEARCH_STRATEGIES, results):
+        if isinstance(result, BaseException):
+            notify("error", f"The '{strategy}' strategy failed and is left out of the results: {result}")
+        else:
+            queries[strategy], ranked_lists[strategy] = result
+    return reciprocal_rank_fusion(ranked_lists)[:max_results], queries
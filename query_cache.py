@@ -0,0 +1,139 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from", "how", "in", "is",
+    "it", "of", "on", "or", "should", "the", "to", "what", "when", "which", "who", "with",
+}
+NUM_PERMUTATIONS = 64
+# Largest prime below 2**32, so (a * h + b) with a, b, h < PRIME never overflows uint64
+PRIME = 4294967291
+_rng = np.random.default_rng(42)
+_PERM_A = _rng.integers(1, PRIME, NUM_PERMUTATIONS, dtype=np.uint64)
+_PERM_B = _rng.integers(0, PRIME, NUM_PERMUTATIONS, dtype=np.uint64)
+
+
+# Function to normalize a question so trivial differences in case, spacing and punctuation share a cache entry
+def normalize_question(question: str) -> str:
+    return " ".join(re.findall(r"[a-z0-9]+", question.lower()))
+
+
+# Function to collect the tokens containing digits, which must match exactly for two questions to be similar
+def number_tokens(question: str) -> set:
+    return {token for token in normalize_question(question).split() if any(char.isdigit() for char in token)}
+
+
+# Function to compute a MinHash signature over character 3-grams of the question's content words
+def minhash_signature(question: str) -> np.ndarray:
+    words = [word.rstrip("s") if len(word) > 3 else word for word in normalize_question(question).split() if word not in STOPWORDS]
+    text = f" {' '.join(words)} "
+    shingles = {text[i:i + 3] for i in range(max(1, len(text) - 2))}
+    hashes = np.array([zlib.crc32(shingle.encode()) % PRIME for shingle in shingles], dtype=np.uint64)
+    return ((_PERM_A[:, None] * hashes[None, :] + _PERM_B[:, None]) % PRIME).min(axis=1)
+
+
+class QueryCache:
+    """
+    SQLite-backed cache of optimized PubMed queries keyed by (system prompt hash, normalized question).
+    With a similarity_threshold set, a miss falls back to the most similar cached question for the
+    same prompt by MinHash-estimated Jaccard similarity.
+    """
+
+    def __init__(self, path: str = "query_cache.sqlite3", ttl_seconds: float = 30 * 24 * 3600, max_entries: int = 10000, similarity_threshold: Optional[float] = None) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS queries ("
+            "prompt_hash TEXT NOT NULL, question TEXT NOT NULL, optimized TEXT NOT NULL, signature BLOB NOT NULL, "
+            "latency REAL NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL, PRIMARY KEY (prompt_hash, question))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS queries_accessed_at ON queries (accessed_at)")
+        self._conn.commit()
+
+    @staticmethod
+    def _prompt_hash(system_prompt: str) -> str:
+        return hashlib.sha256(system_prompt.encode()).hexdigest()[:16]
+
+    def get(self, system_prompt: str, question: str) -> Optional[Tuple[str, str]]:
+        """Return (optimized query, "exact" or "similar") or None on a miss."""
+        prompt_hash = self._prompt_hash(system_prompt)
+        normalized = normalize_question(question)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT question, optimized, latency FROM queries WHERE prompt_hash = ? AND question = ? AND created_at >= ?",
+                (prompt_hash, normalized, now - self.ttl_seconds),
+            ).fetchone()
+            kind = "exact"
+            if row is None and self.similarity_threshold is not None:
+                row = self._most_similar(prompt_hash, question, now)
+                kind = "similar"
+            if row is None:
+                self.misses += 1
+                return None
+
+            cached_question, optimized, latency = row
+            self._conn.execute("UPDATE queries SET accessed_at = ? WHERE prompt_hash = ? AND question = ?", (now, prompt_hash, cached_question))
+            self._conn.commit()
+            if kind == "exact":
+                self.exact_hits += 1
+            else:
+                self.similar_hits += 1
+            self.saved_seconds += latency
+            return optimized, kind
+
+    def _most_similar(self, prompt_hash: str, question: str, now: float) -> Optional[Tuple[str, str, float]]:
+        rows = self._conn.execute(
+            "SELECT question, optimized, latency, signature FROM queries WHERE prompt_hash = ? AND created_at >= ?",
+            (prompt_hash, now - self.ttl_seconds),
+        ).fetchall()
+        if not rows:
+            return None
+        signatures = np.frombuffer(b"".join(row[3] for row in rows), dtype=np.uint64).reshape(len(rows), NUM_PERMUTATIONS)
+        similarity = (signatures == minhash_signature(question)).mean(axis=1)
+        # "type 1 diabetes" and "type 2 diabetes" are lexically close but never interchangeable
+        numbers = number_tokens(question)
+        similarity[[number_tokens(row[0]) != numbers for row in rows]] = 0.0
+        best = int(similarity.argmax())
+        if similarity[best] < self.similarity_threshold:
+            return None
+        return rows[best][:3]
+
+    def put(self, system_prompt: str, question: str, optimized: str, latency: float) -> None:
+        now = time.time()
+        row = (self._prompt_hash(system_prompt), normalize_question(question), optimized, minhash_signature(question).tobytes(), latency, now, now)
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO queries VALUES (?, ?, ?, ?, ?, ?, ?)", row)
+            self._conn.execute("DELETE FROM queries WHERE created_at < ?", (now - self.ttl_seconds,))
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM queries").fetchone()
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM queries WHERE rowid IN (SELECT rowid FROM queries ORDER BY accessed_at LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.exact_hits + self.similar_hits + self.misses
+        return {
+            "exact_hits": self.exact_hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "hit_rate": (self.exact_hits + self.similar_hits) / lookups if lookups else 0.0,
+            "saved_seconds": self.saved_seconds,
+        }
@@ -0,0 +1,100 @@
+import asyncio
+import collections
+import random
+import time
+from typing import Deque, Dict, Optional
+
+
+class RateLimiter:
+    """
+    Async token bucket shared by every search running on one event loop.
+    Waiters are queued per client and served round-robin, so one user's large
+    fetch cannot starve everyone else. A 429 with Retry-After pauses the bucket.
+    """
+
+    def __init__(self, rate: float = 10, burst: int = 1) -> None:
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._queues: "collections.OrderedDict[str, Deque[asyncio.Future]]" = collections.OrderedDict()
+        self._dispatcher: Optional[asyncio.Task] = None
+        self.acquired = 0
+        self.throttled = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    async def acquire(self, client: str = "default") -> float:
+        """Wait for a token; returns the time spent waiting in seconds."""
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        self._queues.setdefault(client, collections.deque()).append(waiter)
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = loop.create_task(self._dispatch())
+
+        start = time.monotonic()
+        await waiter
+        waited = time.monotonic() - start
+        self.acquired += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+        return waited
+
+    async def _dispatch(self) -> None:
+        while self._queues:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                continue
+
+            # Serve the client at the front, then move it to the back of the rotation
+            client, queue = next(iter(self._queues.items()))
+            waiter = queue.popleft()
+            if queue:
+                self._queues.move_to_end(client)
+            else:
+                del self._queues[client]
+            if not waiter.done():
+                self._tokens -= 1
+                waiter.set_result(None)
+
+    def penalize(self, retry_after: Optional[float] = None) -> None:
+        """Record a 429 and stop handing out tokens until Retry-After has passed."""
+        self.throttled += 1
+        self._tokens = 0.0
+        if retry_after:
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None, base: float = 0.5, cap: float = 30) -> float:
+        """Delay before retrying: Retry-After when the server sent one, otherwise full-jitter exponential backoff."""
+        if retry_after is not None:
+            return retry_after + random.uniform(0, base)
+        return random.uniform(0, min(cap, base * 2 ** attempt))
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "queue_depth": self.queue_depth,
+            "waiting_clients": len(self._queues),
+            "acquired": self.acquired,
+            "throttled": self.throttled,
+            "mean_wait": self.total_wait / self.acquired if self.acquired else 0.0,
+            "max_wait": self.max_wait,
+        }
+
+
+# Function to read a Retry-After header given in seconds
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        return None
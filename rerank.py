@@ -0,0 +1,112 @@
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+# Function to split text into lowercase word tokens
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    """
+    In-memory BM25 index over article titles and abstracts, keyed by article link.
+    Articles can be added across searches up to max_documents; postings are frozen into
+    NumPy arrays on first use so scoring a query is a handful of vectorized operations per term.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, max_documents: int = 1000) -> None:
+        self.k1 = k1
+        self.b = b
+        self.max_documents = max_documents
+        self.clear()
+
+    def clear(self) -> None:
+        self._doc_ids: Dict[str, int] = {}
+        self._lengths: List[int] = []
+        self._postings: Dict[str, Tuple[List[int], List[int]]] = {}
+        self._frozen: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._length_array: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    def __contains__(self, link: str) -> bool:
+        return link in self._doc_ids
+
+    def add(self, articles: List[Dict[str, str]]) -> None:
+        for article in articles:
+            if article['link'] in self._doc_ids:
+                continue
+            doc = len(self._lengths)
+            self._doc_ids[article['link']] = doc
+            tokens = tokenize(f"{article['title']} {article['abstract']}")
+            self._lengths.append(len(tokens))
+            counts: Dict[str, int] = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, count in counts.items():
+                docs, tfs = self._postings.setdefault(token, ([], []))
+                docs.append(doc)
+                tfs.append(count)
+                self._frozen.pop(token, None)
+        self._length_array = None
+
+    def _term(self, token: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        if token not in self._postings:
+            return None
+        if token not in self._frozen:
+            docs, tfs = self._postings[token]
+            self._frozen[token] = (np.array(docs, dtype=np.int64), np.array(tfs, dtype=np.float64))
+        return self._frozen[token]
+
+    def scores(self, query: str) -> np.ndarray:
+        """BM25 score of every indexed document for the query."""
+        if self._length_array is None:
+            self._length_array = np.array(self._lengths, dtype=np.float64)
+        lengths = self._length_array
+        scores = np.zeros(len(lengths))
+        if not len(lengths):
+            return scores
+        length_norm = self.k1 * (1 - self.b + self.b * lengths / max(lengths.mean(), 1.0))
+        for token in set(tokenize(query)):
+            term = self._term(token)
+            if term is None:
+                continue
+            docs, tfs = term
+            idf = np.log(1 + (len(lengths) - len(docs) + 0.5) / (len(docs) + 0.5))
+            scores[docs] += idf * tfs * (self.k1 + 1) / (tfs + length_norm[docs])
+        return scores
+
+    def doc_ids(self, links: List[str]) -> np.ndarray:
+        return np.array([self._doc_ids[link] for link in links], dtype=np.int64)
+
+
+# Function to re-rank candidate articles by BM25 against the user's question, staying within a latency budget
+def rerank_articles(index: BM25Index, query: str, articles: List[Dict[str, str]], top_k: int, budget_seconds: float = 0.5, chunk_size: int = 500) -> List[Dict[str, str]]:
+    start = time.perf_counter()
+    new_articles = [article for article in articles if article['link'] not in index]
+    if len(index) + len(new_articles) > index.max_documents:
+        # Postings cannot drop one document cheaply, so a full index starts over with just these candidates
+        index.clear()
+        new_articles = articles[:index.max_documents]
+    for i in range(0, len(new_articles), chunk_size):
+        if time.perf_counter() - start > budget_seconds:
+            break
+        index.add(new_articles[i:i + chunk_size])
+
+    # Articles the budget left unindexed keep their ESearch order after the scored ones
+    indexed = [article for article in articles if article['link'] in index]
+    unindexed = [article for article in articles if article['link'] not in index]
+    if not indexed:
+        return articles[:top_k]
+    scores = index.scores(query)[index.doc_ids([article['link'] for article in indexed])]
+    if not scores.any():
+        return articles[:top_k]
+    # Stable sort keeps the ESearch relevance order between equal scores
+    order = np.argsort(-scores, kind="stable")
+    return ([indexed[i] for i in order] + unindexed)[:top_k]
@@ -0,0 +1,77 @@
+import collections
+import sys
+import threading
+from typing import Dict, Iterable, List
+
+
+# Function to intern a list of strings that repeat across articles (journals, publication types, MeSH terms)
+def intern_all(values: Iterable[str]) -> tuple:
+    return tuple(sys.intern(value) for value in values)
+
+
+class StoredArticle:
+    __slots__ = ("pmid", "title", "year", "abstract", "journal", "doi", "authors", "publication_types", "mesh_terms")
+
+    def __init__(self, pmid: str, title: str, year: str, abstract: str, journal: str = "", doi: str = "",
+                 authors: Iterable[str] = (), publication_types: Iterable[str] = (), mesh_terms: Iterable[str] = ()) -> None:
+        self.pmid = pmid
+        self.title = title
+        self.year = sys.intern(year)  # A few dozen distinct years across every stored article
+        self.abstract = abstract
+        self.journal = sys.intern(journal)
+        self.doi = doi
+        self.authors = tuple(authors)
+        self.publication_types = intern_all(publication_types)
+        self.mesh_terms = intern_all(mesh_terms)
+
+    def as_dict(self) -> Dict:
+        return {
+            'pmid': self.pmid,
+            'title': self.title,
+            'year': self.year,
+            'link': f"https://pubmed.ncbi.nlm.nih.gov/{self.pmid}",
+            'abstract': self.abstract,
+            'journal': self.journal,
+            'doi': self.doi,
+            'authors': list(self.authors),
+            'publication_types': list(self.publication_types),
+            'mesh_terms': list(self.mesh_terms),
+        }
+
+
+class ResultStore:
+    """
+    Process-wide store of displayed articles keyed by PMID, shared by every Streamlit session.
+    Sessions keep only their ordered PMID list; the least recently stored articles are evicted
+    beyond max_entries, so a session whose PMIDs were evicted should re-run its search.
+    """
+
+    def __init__(self, max_entries: int = 20000) -> None:
+        self.max_entries = max_entries
+        self._articles: "collections.OrderedDict[str, StoredArticle]" = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._articles)
+
+    def put_many(self, articles: Iterable[Dict]) -> List[str]:
+        """Store articles and return their PMIDs in the given order."""
+        pmids = []
+        with self._lock:
+            for article in articles:
+                pmid = article['pmid']
+                self._articles[pmid] = StoredArticle(
+                    pmid, article['title'], article['year'], article['abstract'],
+                    article.get('journal', ""), article.get('doi', ""), article.get('authors', ()),
+                    article.get('publication_types', ()), article.get('mesh_terms', ()),
+                )
+                self._articles.move_to_end(pmid)
+                pmids.append(pmid)
+            while len(self._articles) > self.max_entries:
+                self._articles.popitem(last=False)
+        return pmids
+
+    def get_many(self, pmids: List[str]) -> List[Dict]:
+        """Return the stored articles for the PMIDs, in order, skipping any that were evicted."""
+        with self._lock:
+            return [self._articles[pmid].as_dict() for pmid in pmids if pmid in self._articles]
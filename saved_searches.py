@@ -0,0 +1,214 @@
+"""
+Watched searches: saved PubMed queries whose results are kept current by incremental refreshes.
+
+    python saved_searches.py add "statins elderly" '("statins"[MeSH]) AND elderly' --years-back 3
+    python saved_searches.py refresh            # every watched search, e.g. from a weekly cron job
+    python saved_searches.py list
+
+A refresh asks ESearch only for records added to PubMed (EDAT) since the last run and fetches
+details only for PMIDs the search has never seen, at most --max-results per refresh; any beyond
+that are fetched by the following refreshes. Reads NCBI_API_KEY (and EUTILS_BASE_URL) from the environment.
+"""
+import argparse
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import aiohttp
+
+from pubmed_search import article_from_record, build_search_query, esearch, notify, stream_articles_batched
+
+REFRESH_PAGE_SIZE = 500  # ESearch page size when collecting a refresh's new PMIDs
+
+
+class SavedSearchStore:
+    """
+    SQLite-backed watched searches with the PMIDs each has seen and the articles it has kept.
+    Every refresh is numbered; articles kept by the latest refresh (after the first) are marked new.
+    """
+
+    def __init__(self, path: str = "saved_searches.sqlite3") -> None:
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS searches ("
+            "id INTEGER PRIMARY KEY, name TEXT NOT NULL, query TEXT NOT NULL, years_back INTEGER NOT NULL, human_only INTEGER NOT NULL, "
+            "max_results INTEGER NOT NULL, created_at REAL NOT NULL, last_run_at REAL, last_run_date TEXT, runs INTEGER NOT NULL DEFAULT 0)"
+        )
+        # Every PMID a search has checked, including those dropped for lacking an abstract, so none is fetched twice
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS seen ("
+            "search_id INTEGER NOT NULL REFERENCES searches (id) ON DELETE CASCADE, pmid TEXT NOT NULL, "
+            "run INTEGER NOT NULL, rank INTEGER NOT NULL, article TEXT, PRIMARY KEY (search_id, pmid))"
+        )
+        self._conn.commit()
+
+    def add(self, name: str, query: str, years_back: int = 3, human_only: bool = False, max_results: int = 200) -> int:
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO searches (name, query, years_back, human_only, max_results, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (name, query, years_back, int(human_only), max_results, time.time()),
+            )
+            self._conn.commit()
+            return cursor.lastrowid
+
+    def remove(self, search_id: int) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM searches WHERE id = ?", (search_id,))
+            self._conn.commit()
+
+    def list(self) -> List[Dict]:
+        """Every watched search with its kept and new article counts."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT s.id, s.name, s.query, s.years_back, s.human_only, s.max_results, s.last_run_at, s.last_run_date, s.runs, "
+                "COUNT(r.article), COUNT(CASE WHEN r.run = s.runs AND s.runs > 1 THEN r.article END) "
+                "FROM searches s LEFT JOIN seen r ON r.search_id = s.id GROUP BY s.id ORDER BY s.name"
+            ).fetchall()
+        columns = ("id", "name", "query", "years_back", "human_only", "max_results", "last_run_at", "last_run_date", "runs", "articles", "new")
+        return [{**dict(zip(columns, row)), "human_only": bool(row[4])} for row in rows]
+
+    def get(self, search_id: int) -> Optional[Dict]:
+        return next((search for search in self.list() if search["id"] == search_id), None)
+
+    def seen_pmids(self, search_id: int) -> set:
+        with self._lock:
+            return {pmid for (pmid,) in self._conn.execute("SELECT pmid FROM seen WHERE search_id = ?", (search_id,))}
+
+    def record_run(self, search_id: int, checked: List[str], articles: Dict[str, Dict], run_at: float, run_date: str) -> int:
+        """Store a refresh's checked PMIDs, in relevance order, and the articles kept among them; returns the run number."""
+        with self._lock:
+            (runs,) = self._conn.execute("SELECT runs FROM searches WHERE id = ?", (search_id,)).fetchone()
+            run = runs + 1
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO seen VALUES (?, ?, ?, ?, ?)",
+                [(search_id, pmid, run, rank, json.dumps(articles[pmid]) if pmid in articles else None) for rank, pmid in enumerate(checked)],
+            )
+            self._conn.execute("UPDATE searches SET last_run_at = ?, last_run_date = ?, runs = ? WHERE id = ?", (run_at, run_date, run, search_id))
+            self._conn.commit()
+            return run
+
+    def results(self, search_id: int) -> List[Dict]:
+        """Kept articles, newest refresh first and in relevance order within a refresh, each with a 'new' flag."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT r.article, r.run = s.runs AND s.runs > 1 FROM seen r JOIN searches s ON s.id = r.search_id "
+                "WHERE r.search_id = ? AND r.article IS NOT NULL ORDER BY r.run DESC, r.rank",
+                (search_id,),
+            ).fetchall()
+        return [{**json.loads(article), 'new': bool(new)} for article, new in rows]
+
+
+# Function to collect up to max_results of a watched search's unseen PMIDs: the top ones on the first run, then those added since
+# the last run. Also returns whether more unseen PMIDs were left out.
+async def unseen_pmids(session: aiohttp.ClientSession, search: Dict, seen: set) -> Tuple[List[str], bool]:
+    search_query = build_search_query(search["query"], search["years_back"], search["human_only"])
+    new_ids = []
+    seen = set(seen)
+    retstart = 0
+    while len(new_ids) <= search["max_results"]:
+        result = await esearch(session, search_query, REFRESH_PAGE_SIZE, retstart, mindate=search["last_run_date"])
+        page = result.get('idlist', [])
+        for id in page:
+            if id not in seen:
+                seen.add(id)
+                new_ids.append(id)
+        retstart += REFRESH_PAGE_SIZE
+        if not page or retstart >= int(result.get('count', 0)):
+            break
+    return new_ids[:search["max_results"]], len(new_ids) > search["max_results"]
+
+
+# Function to refresh one watched search, fetching details only for PMIDs it has never seen
+async def refresh_saved_search(store: SavedSearchStore, search_id: int, session: aiohttp.ClientSession) -> Dict:
+    search = store.get(search_id)
+    if search is None:
+        raise ValueError(f"No saved search with ID {search_id}")
+    run_at = time.time()
+    # Dates have day granularity, so the last run's day is searched again and its PMIDs skipped as seen
+    run_date = datetime.now().strftime("%Y/%m/%d")
+    unseen, truncated = await unseen_pmids(session, search, store.seen_pmids(search_id))
+
+    returned = set()
+    articles = {}
+    async for id, record in stream_articles_batched(session, unseen):
+        # A PMID whose record never came back (NCBI omitted it or the fetch failed) stays unseen, so a later refresh retries it
+        if record is None:
+            continue
+        returned.add(id)
+        article = article_from_record(id, record)
+        if article is not None:
+            articles[id] = article
+    checked = [id for id in unseen if id in returned]
+    unavailable = len(unseen) - len(checked)
+    if unavailable:
+        notify("warning", f"{unavailable} articles for {search['name']} could not be fetched; the next refresh will try them again.")
+    # ESearch only lists PMIDs added since the last run date, so keep the old date until every one has been fetched.
+    # The first run keeps just the top max_results by design; later runs pick up the rest over the next refreshes.
+    if unavailable or (truncated and search["last_run_date"]):
+        run_date = search["last_run_date"]
+    run = store.record_run(search_id, checked, articles, run_at, run_date)
+    return {"id": search_id, "name": search["name"], "run": run, "checked": len(checked), "new": len(articles), "unavailable": unavailable,
+            "more": truncated}
+
+
+# Function to refresh every watched search in turn, sharing one session; a search that fails is reported and skipped
+async def refresh_all(store: SavedSearchStore, session: Optional[aiohttp.ClientSession] = None) -> List[Dict]:
+    if session is None:
+        async with aiohttp.ClientSession() as session:
+            return await refresh_all(store, session)
+    summaries = []
+    for search in store.list():
+        try:
+            summaries.append(await refresh_saved_search(store, search["id"], session))
+        except Exception as e:
+            notify("error", f"Could not refresh {search['name']}: {e}")
+            summaries.append({"id": search["id"], "name": search["name"], "error": str(e)})
+    return summaries
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Manage and refresh watched PubMed searches.")
+    parser.add_argument("--db", default="saved_searches.sqlite3", help="Saved searches database (the app's saved_searches_path)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    add = commands.add_parser("add", help="Watch a PubMed query")
+    add.add_argument("name")
+    add.add_argument("query")
+    add.add_argument("--years-back", type=int, default=3)
+    add.add_argument("--human-only", action="store_true")
+    add.add_argument("--max-results", type=int, default=200, help="Most articles kept per refresh")
+    refresh = commands.add_parser("refresh", help="Fetch new articles for watched searches")
+    refresh.add_argument("--id", type=int, action="append", help="Refresh only this search (repeatable)")
+    commands.add_parser("list", help="Show watched searches")
+    remove = commands.add_parser("remove", help="Stop watching a search")
+    remove.add_argument("id", type=int)
+    args = parser.parse_args()
+
+    store = SavedSearchStore(args.db)
+    if args.command == "add":
+        print(json.dumps({"id": store.add(args.name, args.query, args.years_back, args.human_only, args.max_results)}))
+    elif args.command == "remove":
+        store.remove(args.id)
+    elif args.command == "list":
+        for search in store.list():
+            print(json.dumps(search))
+    elif args.id:
+        async def refresh_selected() -> List[Dict]:
+            async with aiohttp.ClientSession() as session:
+                return [await refresh_saved_search(store, search_id, session) for search_id in args.id]
+
+        for summary in asyncio.run(refresh_selected()):
+            print(json.dumps(summary))
+    else:
+        for summary in asyncio.run(refresh_all(store)):
+            print(json.dumps(summary))
+
+
+if __name__ == "__main__":
+    main()
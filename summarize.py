@@ -0,0 +1,127 @@
+import asyncio
+import json
+import time
+from typing import AsyncIterator, Dict, List, Optional
+
+from metrics import metrics, span
+from prompts import abstract_summary_prompt, synthesis_prompt
+from pubmed_search import create_chat_completion, get_summary_cache, notify, stream_chat_completion
+
+MAP_MODEL = "gpt-4o-mini"  # Per-article summaries are extraction, which the small model does well
+REDUCE_MODEL = "gpt-4o"
+# USD per million prompt and completion tokens; update when OpenAI's prices change
+MODEL_PRICES = {"gpt-4o": (5.00, 15.00), "gpt-4o-mini": (0.15, 0.60)}
+CHARS_PER_TOKEN = 4  # Rough average for English, close enough to size requests without a tokenizer
+
+
+# Function to estimate the number of tokens in a text
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+# Function to add one request's token usage and cost to a summarization's running totals
+def add_usage(stats: Dict, model: str, request_stats: Dict) -> None:
+    prompt_tokens = request_stats.get("prompt_tokens", 0)
+    completion_tokens = request_stats.get("completion_tokens", 0)
+    prompt_price, completion_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    cost = (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1e6
+    stats["prompt_tokens"] = stats.get("prompt_tokens", 0) + prompt_tokens
+    stats["completion_tokens"] = stats.get("completion_tokens", 0) + completion_tokens
+    stats["cost_usd"] = stats.get("cost_usd", 0.0) + cost
+    metrics.inc("llm_cost_usd_total", cost, model=model)
+
+
+# Function to pack articles into batches whose abstracts fit one request's prompt token budget
+def summary_batches(articles: List[Dict], token_budget: int, max_abstract_tokens: int) -> List[List[Dict]]:
+    batches = []
+    batch = []
+    used = 0
+    for article in articles:
+        tokens = estimate_tokens(article['title']) + min(estimate_tokens(article['abstract']), max_abstract_tokens) + 8
+        if batch and used + tokens > token_budget:
+            batches.append(batch)
+            batch = []
+            used = 0
+        batch.append(article)
+        used += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+# Function to get a summary for every article, from the cache or from concurrent batched requests
+async def map_summaries(articles: List[Dict], stats: Dict, max_concurrency: int, token_budget: int, summary_tokens: int,
+                        max_abstract_tokens: int, model: str) -> Dict[str, str]:
+    cache = get_summary_cache()
+    summaries = cache.get_many([article['pmid'] for article in articles], abstract_summary_prompt, model)
+    stats["cached_summaries"] = len(summaries)
+    batches = summary_batches([article for article in articles if article['pmid'] not in summaries], token_budget, max_abstract_tokens)
+    stats["map_requests"] = len(batches)
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def summarize_batch(batch: List[Dict]) -> Dict[str, str]:
+        # Abstracts past the budget are cut, so one long abstract cannot crowd out the rest of its batch
+        content = "\n\n".join(
+            f"PMID {article['pmid']}: {article['title']}\n{article['abstract'][:max_abstract_tokens * CHARS_PER_TOKEN]}" for article in batch
+        )
+        messages = [{"role": "system", "content": abstract_summary_prompt}, {"role": "user", "content": content}]
+        request_stats = {}
+        async with semaphore:
+            try:
+                text = await create_chat_completion(messages, request_stats, model=model, max_tokens=summary_tokens * len(batch),
+                                                    response_format="json_object", temperature=0)
+            except Exception as e:
+                notify("warning", f"Could not summarize {len(batch)} abstracts: {e}")
+                return {}
+        add_usage(stats, model, request_stats)
+        try:
+            parsed = json.loads(text)
+        except json.JSONDecodeError:
+            parsed = None
+        # JSON mode guarantees valid JSON, not an object; an array or a string is treated like unreadable output
+        if not isinstance(parsed, dict):
+            notify("warning", f"Could not read the summaries of {len(batch)} abstracts; their abstracts are used instead.")
+            return {}
+        pmids = {article['pmid'] for article in batch}
+        found = {str(pmid): str(summary).strip() for pmid, summary in parsed.items() if str(pmid) in pmids and summary}
+        cache.put_many(found, abstract_summary_prompt, model)
+        return found
+
+    for found in await asyncio.gather(*(summarize_batch(batch) for batch in batches)):
+        summaries.update(found)
+    return summaries
+
+
+# Function to build the synthesis request from the question and numbered article summaries
+def synthesis_messages(question: str, articles: List[Dict], summaries: Dict[str, str], max_abstract_tokens: int) -> List[Dict[str, str]]:
+    numbered = "\n".join(
+        f"[{i}] {article['title']} ({article.get('journal') or 'PubMed'}, {article['year']}): "
+        f"{summaries.get(article['pmid']) or article['abstract'][:max_abstract_tokens * CHARS_PER_TOKEN]}"
+        for i, article in enumerate(articles, start=1)
+    )
+    return [
+        {"role": "system", "content": synthesis_prompt},
+        {"role": "user", "content": f"Question: {question}\n\nArticles:\n{numbered}"},
+    ]
+
+
+# Function to stream a cited answer to the question synthesized from the articles; [n] cites the nth article.
+# Token usage, cost and latency are written into stats.
+async def summarize_articles(question: str, articles: List[Dict], stats: Optional[Dict] = None, max_concurrency: int = 8, token_budget: int = 3000,
+                             summary_tokens: int = 120, max_abstract_tokens: int = 600, answer_tokens: int = 800,
+                             map_model: str = MAP_MODEL, reduce_model: str = REDUCE_MODEL) -> AsyncIterator[str]:
+    if stats is None:
+        stats = {}
+    start = time.perf_counter()
+    with span("summarize.map", articles=len(articles)):
+        summaries = await map_summaries(articles, stats, max_concurrency, token_budget, summary_tokens, max_abstract_tokens, map_model)
+    stats["map_seconds"] = time.perf_counter() - start
+
+    reduce_stats = {}
+    async for answer in stream_chat_completion(synthesis_messages(question, articles, summaries, max_abstract_tokens), stats=reduce_stats,
+                                               model=reduce_model, max_tokens=answer_tokens, temperature=0.2):
+        if "first_token_seconds" not in stats:
+            stats["first_token_seconds"] = time.perf_counter() - start
+        yield answer
+    add_usage(stats, reduce_model, reduce_stats)
+    stats["total_seconds"] = time.perf_counter() - start
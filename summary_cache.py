@@ -0,0 +1,78 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from typing import Dict, List
+
+
+class SummaryCache:
+    """
+    SQLite-backed per-article summaries keyed by (PMID, summary prompt hash, model), so an article
+    that turns up in another search is never summarized twice. Entries older than ttl_seconds are
+    misses, and beyond max_entries the least recently read are evicted.
+    """
+
+    def __init__(self, path: str = "summary_cache.sqlite3", ttl_seconds: float = 30 * 24 * 3600, max_entries: int = 50000) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS summaries ("
+            "pmid TEXT NOT NULL, prompt_hash TEXT NOT NULL, summary TEXT NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL, "
+            "PRIMARY KEY (pmid, prompt_hash))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS summaries_accessed_at ON summaries (accessed_at)")
+        self._conn.commit()
+
+    @staticmethod
+    def _prompt_hash(system_prompt: str, model: str) -> str:
+        return hashlib.sha256(f"{model}\n{system_prompt}".encode()).hexdigest()[:16]
+
+    def get_many(self, pmids: List[str], system_prompt: str, model: str) -> Dict[str, str]:
+        if not pmids:
+            return {}
+        prompt_hash = self._prompt_hash(system_prompt, model)
+        now = time.time()
+        placeholders = ",".join("?" * len(pmids))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT pmid, summary FROM summaries WHERE prompt_hash = ? AND pmid IN ({placeholders}) AND created_at >= ?",
+                [prompt_hash, *pmids, now - self.ttl_seconds],
+            ).fetchall()
+            found = dict(rows)
+            if found:
+                self._conn.executemany(
+                    "UPDATE summaries SET accessed_at = ? WHERE pmid = ? AND prompt_hash = ?",
+                    [(now, pmid, prompt_hash) for pmid in found],
+                )
+                self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(pmids) - len(found)
+        return found
+
+    def put_many(self, summaries: Dict[str, str], system_prompt: str, model: str) -> None:
+        if not summaries:
+            return
+        prompt_hash = self._prompt_hash(system_prompt, model)
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO summaries VALUES (?, ?, ?, ?, ?)",
+                [(pmid, prompt_hash, summary, now, now) for pmid, summary in summaries.items()],
+            )
+            self._conn.execute("DELETE FROM summaries WHERE created_at < ?", (now - self.ttl_seconds,))
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM summaries").fetchone()
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM summaries WHERE rowid IN (SELECT rowid FROM summaries ORDER BY accessed_at LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0}
@@ -0,0 +1,58 @@
+import contextlib
+import os
+import sys
+
+import pytest
+from openai import AsyncOpenAI
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pubmed_search  # noqa: E402
+from article_cache import ArticleCache  # noqa: E402
+from mock_servers import MockChatCompletions, MockEutils, start_server  # noqa: E402
+from query_cache import QueryCache  # noqa: E402
+from summary_cache import SummaryCache  # noqa: E402
+
+
+# Every test gets its own on-disk caches, so results never come from an earlier test
+@pytest.fixture(autouse=True)
+def fresh_resources(tmp_path, monkeypatch):
+    monkeypatch.setattr(pubmed_search, "_resources", {})
+    pubmed_search.configure(
+        pubmed_api_key="test",
+        article_cache=ArticleCache(str(tmp_path / "articles.sqlite3")),
+        query_cache=QueryCache(str(tmp_path / "queries.sqlite3")),
+        summary_cache=SummaryCache(str(tmp_path / "summaries.sqlite3")),
+    )
+
+
+# Async context manager that serves a MockEutils on a free port and points the pipeline at it
+@pytest.fixture
+def serve_eutils(monkeypatch):
+    @contextlib.asynccontextmanager
+    async def serve(eutils: MockEutils):
+        runner = await start_server(eutils.app(), 0)
+        monkeypatch.setattr(pubmed_search, "EUTILS_BASE_URL", "http://{}:{}".format(*runner.addresses[0]))
+        try:
+            yield eutils
+        finally:
+            await runner.cleanup()
+
+    return serve
+
+
+# Async context manager that serves a MockChatCompletions on a free port and points the pipeline's OpenAI client at it
+@pytest.fixture
+def serve_chat():
+    @contextlib.asynccontextmanager
+    async def serve(chat: MockChatCompletions):
+        runner = await start_server(chat.app(), 0)
+        openai_client = AsyncOpenAI(base_url="http://{}:{}/v1".format(*runner.addresses[0]), api_key="test", max_retries=0)
+        pubmed_search.configure(openai_client=openai_client)
+        try:
+            yield chat
+        finally:
+            await openai_client.close()
+            await runner.cleanup()
+
+    return serve
@@ -0,0 +1,68 @@
+import asyncio
+import json
+
+import pyarrow.parquet as pq
+from openai import AsyncOpenAI
+
+import pubmed_search
+from batch_runner import completed_ids, drop_partial_line, run_batch
+from mock_servers import MockChatCompletions, MockEutils, start_server
+
+
+def test_drop_partial_line_keeps_only_complete_results(tmp_path):
+    checkpoint = tmp_path / "out.jsonl"
+    checkpoint.write_text(json.dumps({"id": "1"}) + "\n" + json.dumps({"id": "2"})[:5], encoding="utf-8")
+    drop_partial_line(str(checkpoint))
+    assert checkpoint.read_text(encoding="utf-8") == json.dumps({"id": "1"}) + "\n"
+    assert completed_ids(str(checkpoint)) == {"1"}
+
+
+def test_resume_after_an_interrupted_write_produces_parquet(serve_eutils, tmp_path):
+    questions = tmp_path / "questions.jsonl"
+    questions.write_text("".join(json.dumps({"id": str(i), "question": f"statins question {i}"}) + "\n" for i in range(1, 4)), encoding="utf-8")
+    checkpoint = tmp_path / "out.parquet.jsonl"
+    # The first question finished; the second was cut off mid-write
+    checkpoint.write_text(json.dumps({"id": "1", "question": "statins question 1", "articles": []}) + "\n" + '{"id": "2", "que', encoding="utf-8")
+
+    async def resume():
+        chat = MockChatCompletions(token_delay=0, first_token_delay=0)
+        chat_runner = await start_server(chat.app(), 0)
+        openai_client = AsyncOpenAI(base_url="http://{}:{}/v1".format(*chat_runner.addresses[0]), api_key="test", max_retries=0)
+        pubmed_search.configure(openai_client=openai_client)
+        try:
+            async with serve_eutils(MockEutils(latency=0)):
+                return await run_batch(str(questions), str(tmp_path / "out.parquet"))
+        finally:
+            await openai_client.close()
+            await chat_runner.cleanup()
+
+    summary = asyncio.run(resume())
+    assert (summary["completed"], summary["skipped"], summary["failed"]) == (2, 1, 0)
+    assert sorted(pq.read_table(tmp_path / "out.parquet").column("id").to_pylist()) == ["1", "2", "3"]
+
+
+def test_questions_whose_search_failed_are_retried_by_the_next_run(serve_eutils, tmp_path, monkeypatch):
+    questions = tmp_path / "questions.jsonl"
+    questions.write_text(json.dumps({"id": "1", "question": "statins question"}) + "\n", encoding="utf-8")
+    output = str(tmp_path / "out.jsonl")
+
+    async def run_twice():
+        chat = MockChatCompletions(token_delay=0, first_token_delay=0)
+        chat_runner = await start_server(chat.app(), 0)
+        openai_client = AsyncOpenAI(base_url="http://{}:{}/v1".format(*chat_runner.addresses[0]), api_key="test", max_retries=0)
+        pubmed_search.configure(openai_client=openai_client)
+        try:
+            monkeypatch.setattr(pubmed_search, "EUTILS_BASE_URL", "http://127.0.0.1:9")  # NCBI is down: nothing listens here
+            outage = await run_batch(str(questions), output)
+            async with serve_eutils(MockEutils(latency=0)):
+                recovered = await run_batch(str(questions), output)
+        finally:
+            await openai_client.close()
+            await chat_runner.cleanup()
+        return outage, recovered
+
+    outage, recovered = asyncio.run(run_twice())
+    assert (outage["completed"], outage["failed"]) == (0, 1)
+    assert (recovered["completed"], recovered["failed"], recovered["skipped"]) == (1, 0, 0)
+    rows = [json.loads(line) for line in open(output, encoding="utf-8")]
+    assert [(row["id"], len(row["articles"])) for row in rows] == [("1", 5)]
@@ -0,0 +1,34 @@
+import asyncio
+
+from openai import AsyncOpenAI
+
+from benchmark import run_scenario
+from mock_servers import MockChatCompletions, MockEutils, start_server
+
+
+async def scenario_requests(serve_eutils, throttle_rate: float) -> dict:
+    chat = MockChatCompletions(token_delay=0, first_token_delay=0)
+    chat_runner = await start_server(chat.app(), 0)
+    openai_client = AsyncOpenAI(base_url="http://{}:{}/v1".format(*chat_runner.addresses[0]), api_key="test", max_retries=0)
+    try:
+        async with serve_eutils(MockEutils(latency=0, throttle_rate=throttle_rate, retry_after=0.01, seed=1)) as eutils:
+            scenario = await run_scenario(eutils, chat, openai_client, max_results=5, users=4, rate=200)
+    finally:
+        await openai_client.close()
+        await chat_runner.cleanup()
+    return scenario
+
+
+def requests_sent(scenario: dict) -> int:
+    return sum(scenario["eutils_requests"][endpoint] for endpoint in ("esearch", "esummary", "efetch"))
+
+
+def test_throttled_run_retries_until_every_user_has_results(serve_eutils):
+    unthrottled = asyncio.run(scenario_requests(serve_eutils, 0.0))
+    throttled = asyncio.run(scenario_requests(serve_eutils, 0.3))
+
+    assert unthrottled["eutils_requests"]["throttled"] == 0
+    assert throttled["eutils_requests"]["throttled"] > 0
+    # Every 429 reached the client and was retried, so the throttled run needed more requests for the same results
+    assert requests_sent(throttled) == requests_sent(unthrottled) + throttled["eutils_requests"]["throttled"]
+    assert throttled["articles_per_user"] == unthrottled["articles_per_user"] == 5
@@ -0,0 +1,58 @@
+import asyncio
+
+import aiohttp
+
+import pubmed_search
+from metrics import Trace, metrics, search_trace
+from mock_servers import MockEutils
+from pubmed_search import configure, fetch_additional_results, search_notices
+from rate_limiter import RateLimiter
+
+
+def test_rate_limiter_queue_depth_is_exported_as_a_gauge():
+    async def render_while_queued():
+        limiter = RateLimiter(rate=1)
+        configure(rate_limiter=limiter)
+        waiters = [asyncio.create_task(limiter.acquire(client)) for client in ("a", "a", "b")]
+        await asyncio.sleep(0.01)  # The first waiter is served at once; the other two wait for tokens
+        rendered = metrics.render()
+        for waiter in waiters:
+            waiter.cancel()
+        return rendered
+
+    rendered = asyncio.run(render_while_queued())
+    assert "# TYPE pubmed_rate_limiter_queue_depth gauge" in rendered
+    assert "pubmed_rate_limiter_queue_depth 2" in rendered.splitlines()
+    assert "pubmed_rate_limiter_waiting_clients 2" in rendered.splitlines()
+
+
+def test_topup_errors_reach_the_session_notices_and_error_counter(monkeypatch):
+    monkeypatch.setattr(pubmed_search, "EUTILS_BASE_URL", "http://127.0.0.1:9")  # Nothing listens on the discard port
+    errors_before = metrics.counter("pubmed_search_errors_total")
+
+    async def fetch_page():
+        notices = []
+        search_notices.set(notices)
+        async with aiohttp.ClientSession() as session:
+            result = await fetch_additional_results(session, "statins", 20, 20, set())
+        return result, notices
+
+    result, notices = asyncio.run(fetch_page())
+    assert result == ([], False)
+    assert [level for level, _ in notices] == ["error"]
+    assert metrics.counter("pubmed_search_errors_total") == errors_before + 1
+
+
+def test_parse_span_covers_the_xml_parsing(serve_eutils):
+    async def traced_search():
+        trace = Trace()
+        search_trace.set(trace)
+        async with serve_eutils(MockEutils(latency=0, missing_abstract_rate=0)), aiohttp.ClientSession() as session:
+            articles, _ = await pubmed_search.pubmed_abstracts("statins elderly", max_results=500, session=session)
+        return trace, articles
+
+    trace, articles = asyncio.run(traced_search())
+    parse_seconds = sum(item.duration for item in trace.spans if item.name == "parse")
+    # Parsing 500 generated articles takes tens of milliseconds; timing only the generator's creation records microseconds
+    assert len(articles) == 500
+    assert parse_seconds > 0.01
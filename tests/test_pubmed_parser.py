@@ -0,0 +1,106 @@
+import pytest
+
+from pubmed_parser import iter_pubmed_articles
+
+STRUCTURED = """
+<PubmedArticle>
+  <MedlineCitation>
+    <PMID Version="1">38000001</PMID>
+    <Article>
+      <Journal>
+        <JournalIssue><PubDate><Year>2023</Year><Month>Jan</Month></PubDate></JournalIssue>
+        <Title>The Lancet</Title>
+      </Journal>
+      <ArticleTitle>Statins and <i>CYP3A4</i> in people over 75<sup>1</sup></ArticleTitle>
+      <ELocationID EIdType="pii">S0140-6736(23)00001-1</ELocationID>
+      <ELocationID EIdType="doi">10.1016/S0140-6736(23)00001-1</ELocationID>
+      <Abstract>
+        <AbstractText Label="BACKGROUND">Statins lower LDL<sub>c</sub>.</AbstractText>
+        <AbstractText Label="RESULTS">Events fell by <b>21%</b> (HR 0.79).</AbstractText>
+      </Abstract>
+      <AuthorList>
+        <Author><LastName>Smith</LastName><ForeName>Jane</ForeName><Initials>J</Initials></Author>
+        <Author><CollectiveName>STAREE <i>Investigators</i></CollectiveName></Author>
+      </AuthorList>
+      <PublicationTypeList><PublicationType>Randomized Controlled Trial</PublicationType></PublicationTypeList>
+    </Article>
+    <MeshHeadingList>
+      <MeshHeading><DescriptorName>Aged, 80 and over</DescriptorName><QualifierName>drug effects</QualifierName></MeshHeading>
+    </MeshHeadingList>
+  </MedlineCitation>
+  <PubmedData>
+    <ArticleIdList>
+      <ArticleId IdType="pubmed">38000001</ArticleId>
+      <ArticleId IdType="doi">10.9999/ignored-when-elocation-has-one</ArticleId>
+    </ArticleIdList>
+  </PubmedData>
+</PubmedArticle>
+"""
+
+MEDLINE_DATE = """
+<PubmedArticle>
+  <MedlineCitation>
+    <PMID Version="1">38000002</PMID>
+    <Article>
+      <Journal>
+        <JournalIssue><PubDate><MedlineDate>2021 Dec-2022 Jan</MedlineDate></PubDate></JournalIssue>
+        <ISOAbbreviation>J Am Geriatr Soc</ISOAbbreviation>
+      </Journal>
+      <ArticleTitle>Deprescribing statins</ArticleTitle>
+      <Abstract><AbstractText>An unstructured abstract.</AbstractText></Abstract>
+    </Article>
+  </MedlineCitation>
+  <PubmedData>
+    <ArticleIdList><ArticleId IdType="doi">10.1111/jgs.00002</ArticleId></ArticleIdList>
+  </PubmedData>
+</PubmedArticle>
+"""
+
+NO_ABSTRACT = """
+<PubmedArticle>
+  <MedlineCitation>
+    <PMID Version="1">38000003</PMID>
+    <Article>
+      <Journal><Title>BMJ</Title></Journal>
+      <ArticleTitle>A letter</ArticleTitle>
+      <ArticleDate DateType="Electronic"><Year>2024</Year></ArticleDate>
+    </Article>
+  </MedlineCitation>
+</PubmedArticle>
+"""
+
+
+def article_set(*articles: str) -> str:
+    return '<?xml version="1.0"?><PubmedArticleSet>' + "".join(articles) + "</PubmedArticleSet>"
+
+
+# Small chunks split tags and text across feeds, as a streamed EFetch response does
+@pytest.mark.parametrize("chunk_size", [7, 64 * 1024])
+def test_parses_every_field_of_a_structured_article(chunk_size):
+    [record] = iter_pubmed_articles(article_set(STRUCTURED), chunk_size=chunk_size)
+    assert record.pmid == "38000001"
+    assert record.title == "Statins and CYP3A4 in people over 751"
+    assert record.year == "2023"
+    assert record.journal == "The Lancet"
+    assert record.sections == [("BACKGROUND", "Statins lower LDLc."), ("RESULTS", "Events fell by 21% (HR 0.79).")]
+    assert record.abstract == "BACKGROUND: Statins lower LDLc. RESULTS: Events fell by 21% (HR 0.79)."
+    assert record.authors == ("Smith J", "STAREE Investigators")
+    assert record.doi == "10.1016/S0140-6736(23)00001-1"
+    assert record.publication_types == ("Randomized Controlled Trial",)
+    assert record.mesh_terms == ("Aged, 80 and over",)
+
+
+def test_falls_back_for_year_journal_and_doi():
+    medline_date, no_abstract = iter_pubmed_articles(article_set(MEDLINE_DATE, NO_ABSTRACT))
+    assert medline_date.year == "2021"
+    assert medline_date.journal == "J Am Geriatr Soc"
+    assert medline_date.doi == "10.1111/jgs.00002"
+    assert medline_date.sections == [("", "An unstructured abstract.")]
+    assert medline_date.abstract == "An unstructured abstract."
+    assert (no_abstract.year, no_abstract.abstract, no_abstract.doi, no_abstract.authors) == ("2024", "", "", ())
+
+
+def test_skips_book_articles_and_keeps_order():
+    book = "<PubmedBookArticle><BookDocument><PMID>1</PMID></BookDocument></PubmedBookArticle>"
+    records = list(iter_pubmed_articles(article_set(NO_ABSTRACT, book, STRUCTURED, MEDLINE_DATE), chunk_size=16))
+    assert [record.pmid for record in records] == ["38000003", "38000001", "38000002"]
@@ -0,0 +1,109 @@
+import asyncio
+import time
+
+import aiohttp
+import pytest
+from aiohttp import web
+from openai import AsyncOpenAI
+
+from background_loop import BackgroundLoop
+from mock_servers import MockChatCompletions, MockEutils, start_server
+from pubmed_search import (MAX_TOPUP_ROUNDS, SEARCH_STRATEGIES, configure, get_query_cache, main_pubmed_prompt, multi_strategy_search,
+                           optimize_query_stream, pubmed_abstracts, search_notices)
+
+
+@pytest.mark.parametrize("missing_abstract_rate", [0.3, 0.9, 1.0])
+def test_topup_requests_are_bounded_and_results_stay_in_rank_order(serve_eutils, missing_abstract_rate):
+    async def search():
+        async with serve_eutils(MockEutils(latency=0, missing_abstract_rate=missing_abstract_rate)) as eutils, aiohttp.ClientSession() as session:
+            articles, _ = await pubmed_abstracts("statins elderly", max_results=20, session=session)
+        return eutils, articles
+
+    eutils, articles = asyncio.run(search())
+    assert eutils.counts["esearch"] <= 1 + MAX_TOPUP_ROUNDS
+    pmids = [article['pmid'] for article in articles]
+    assert len(pmids) == len(set(pmids))
+    # MockEutils numbers a query's PMIDs in relevance order
+    assert pmids == sorted(pmids, key=int)
+    if missing_abstract_rate < 1.0:
+        assert len(articles) == 20
+    else:
+        assert articles == []
+
+
+class FailingStrategyChat(MockChatCompletions):
+    """MockChatCompletions that answers one strategy's system prompt with a server error."""
+
+    def __init__(self, failing_prompt: str, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.failing_prompt = failing_prompt
+
+    async def chat(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        if body["messages"][0]["content"] == self.failing_prompt:
+            self.counts["requests"] += 1
+            return web.json_response({"error": {"message": "mock outage", "type": "server_error"}}, status=500)
+        return await super().chat(request)
+
+
+def test_multi_strategy_search_fuses_the_strategies_that_succeed(serve_eutils, serve_chat):
+    failing = 'relevant clinical trials'
+
+    async def search():
+        notices = []
+        search_notices.set(notices)
+        async with serve_eutils(MockEutils(latency=0)), serve_chat(FailingStrategyChat(SEARCH_STRATEGIES[failing], token_delay=0, first_token_delay=0)):
+            async with aiohttp.ClientSession() as session:
+                articles, queries = await multi_strategy_search("statins elderly", max_results=5, session=session)
+        return articles, queries, notices
+
+    articles, queries, notices = asyncio.run(search())
+    assert set(queries) == set(SEARCH_STRATEGIES) - {failing}
+    assert len(articles) == 5
+    assert all(failing not in article['strategies'] for article in articles)
+    assert [level for level, message in notices if failing in message] == ["error"]
+
+
+def test_optimized_query_streams_incrementally_and_records_usage(serve_chat):
+    async def stream():
+        async with serve_chat(MockChatCompletions(token_delay=0.01, first_token_delay=0.05)) as chat:
+            stats = {}
+            texts = [text async for text in optimize_query_stream(search_terms="statins elderly", stats=stats)]
+        return chat, texts, stats
+
+    chat, texts, stats = asyncio.run(stream())
+    reply = MockChatCompletions.REPLY.replace("{question}", "statins elderly")
+    # One growing text per token, ending with the whole reply
+    assert len(texts) == len(reply.split(" "))
+    assert all(later.startswith(earlier) and len(later) > len(earlier) for earlier, later in zip(texts, texts[1:]))
+    assert texts[-1].strip() == reply
+    assert stats["prompt_tokens"] > 0 and stats["completion_tokens"] == len(texts)
+    assert 0.05 <= stats["first_token_seconds"] < stats["total_seconds"]
+    assert chat.counts["completed"] == 1
+
+
+def test_stopping_a_buffered_stream_closes_the_upstream_request():
+    background_loop = BackgroundLoop()
+    chat = MockChatCompletions(token_delay=0.05, first_token_delay=0)
+
+    async def serve():
+        runner = await start_server(chat.app(), 0)
+        # Created on the background loop, which every request through it then runs on
+        openai_client = AsyncOpenAI(base_url="http://{}:{}/v1".format(*runner.addresses[0]), api_key="test", max_retries=0)
+        return runner, openai_client
+
+    runner, openai_client = background_loop.run(serve())
+    configure(openai_client=openai_client)
+    try:
+        for _ in background_loop.start_stream(optimize_query_stream(search_terms="statins elderly")):
+            break
+        deadline = time.monotonic() + 5
+        while chat.counts["cancelled"] == 0 and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert (chat.counts["cancelled"], chat.counts["completed"]) == (1, 0)
+        # A query cut short is not cached
+        assert get_query_cache().get(main_pubmed_prompt, "statins elderly") is None
+    finally:
+        background_loop.run(openai_client.close())
+        background_loop.run(runner.cleanup())
+        background_loop.close()
@@ -0,0 +1,68 @@
+import asyncio
+import time
+
+import aiohttp
+
+from mock_servers import MockEutils
+from pubmed_search import configure, pubmed_abstracts, search_client
+from rate_limiter import RateLimiter, parse_retry_after
+
+SERVER_RATE = 20  # Requests per second MockEutils accepts before answering 429
+
+
+async def search_as(client: str, question: str, session: aiohttp.ClientSession) -> list:
+    search_client.set(client)
+    articles, _ = await pubmed_abstracts(question, max_results=20, batch_size=5, session=session)
+    return articles
+
+
+async def concurrent_searches(serve_eutils, limiter: RateLimiter):
+    configure(rate_limiter=limiter)
+    eutils = MockEutils(latency=0, max_rate=SERVER_RATE, retry_after=0.2, missing_abstract_rate=0)
+    async with serve_eutils(eutils), aiohttp.ClientSession() as session:
+        results = await asyncio.gather(*(search_as(f"user-{i}", f"question {i}", session) for i in range(4)))
+    return eutils, results
+
+
+def test_no_429s_when_the_limiter_matches_the_server_rate(serve_eutils):
+    limiter = RateLimiter(rate=SERVER_RATE)
+    eutils, results = asyncio.run(concurrent_searches(serve_eutils, limiter))
+    assert eutils.counts["throttled"] == 0
+    assert limiter.throttled == 0
+    assert [len(articles) for articles in results] == [20] * 4
+
+
+def test_429s_above_the_server_rate_pause_the_limiter_and_are_retried(serve_eutils):
+    limiter = RateLimiter(rate=SERVER_RATE * 5, burst=5)
+    eutils, results = asyncio.run(concurrent_searches(serve_eutils, limiter))
+    assert eutils.counts["throttled"] > 0
+    assert limiter.throttled > 0
+    assert [len(articles) for articles in results] == [20] * 4
+
+
+def test_waiters_are_served_round_robin_across_clients():
+    async def acquire_all():
+        limiter = RateLimiter(rate=1000)
+        order = []
+
+        async def acquire(client: str) -> None:
+            await limiter.acquire(client)
+            order.append(client)
+
+        # One client queues three requests before the others queue theirs
+        await asyncio.gather(*(acquire(client) for client in ["a", "a", "a", "b", "b", "c"]))
+        return order
+
+    assert asyncio.run(acquire_all()) == ["a", "b", "c", "a", "b", "a"]
+
+
+def test_penalize_holds_tokens_until_retry_after_has_passed():
+    async def wait_after_penalty():
+        limiter = RateLimiter(rate=1000)
+        await limiter.acquire()
+        limiter.penalize(parse_retry_after("0.2"))
+        start = time.monotonic()
+        await limiter.acquire()
+        return time.monotonic() - start
+
+    assert asyncio.run(wait_after_penalty()) >= 0.2
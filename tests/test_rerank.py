@@ -0,0 +1,22 @@
+from benchmark import RERANK_QUESTION, synthetic_articles
+from rerank import BM25Index, rerank_articles
+
+
+def test_index_starts_over_instead_of_growing_past_max_documents():
+    index = BM25Index(max_documents=300)
+    articles = synthetic_articles(800)
+    for start in (0, 200, 400, 600):
+        candidates = articles[start:start + 200]
+        ranked = rerank_articles(index, RERANK_QUESTION, candidates, top_k=20)
+        assert len(index) <= 300
+        assert all(article['link'] in index for article in candidates)
+        assert {article['pmid'] for article in ranked} <= {article['pmid'] for article in candidates}
+
+
+def test_candidates_already_indexed_are_reused():
+    index = BM25Index(max_documents=300)
+    articles = synthetic_articles(200)
+    first = rerank_articles(index, RERANK_QUESTION, articles, top_k=20)
+    assert len(index) == 200
+    assert rerank_articles(index, RERANK_QUESTION, articles, top_k=20) == first
+    assert len(index) == 200
@@ -0,0 +1,83 @@
+import asyncio
+
+import aiohttp
+from aiohttp import web
+
+from mock_servers import MockEutils
+from saved_searches import SavedSearchStore, refresh_all, refresh_saved_search
+
+
+class DroppingEutils(MockEutils):
+    """MockEutils whose EFetch connections are closed without a response while drop_efetch is set."""
+
+    drop_efetch = True
+
+    async def efetch(self, request: web.Request) -> web.Response:
+        if self.drop_efetch:
+            self.counts["efetch"] += 1
+            request.transport.close()
+            return web.Response()
+        return await super().efetch(request)
+
+
+def test_pmids_whose_fetch_failed_are_retried_by_the_next_refresh(serve_eutils, tmp_path):
+    store = SavedSearchStore(str(tmp_path / "saved.sqlite3"))
+    search_id = store.add("statins", "statins elderly", max_results=10)
+
+    async def refresh_twice():
+        async with serve_eutils(DroppingEutils(latency=0, missing_abstract_rate=0)) as eutils, aiohttp.ClientSession() as session:
+            failed = await refresh_saved_search(store, search_id, session)
+            eutils.drop_efetch = False
+            retried = await refresh_saved_search(store, search_id, session)
+        return failed, retried
+
+    failed, retried = asyncio.run(refresh_twice())
+    assert (failed["checked"], failed["unavailable"]) == (0, 10)
+    assert (retried["checked"], retried["new"], retried["unavailable"]) == (10, 10, 0)
+    assert len(store.seen_pmids(search_id)) == 10
+    assert len(store.results(search_id)) == 10
+
+
+def test_refresh_all_skips_a_failing_search(serve_eutils, tmp_path):
+    store = SavedSearchStore(str(tmp_path / "saved.sqlite3"))
+    store.add("a broken search", "statins elderly")
+    store.add("a working search", "aspirin")
+
+    class FailingEutils(MockEutils):
+        async def esearch(self, request: web.Request) -> web.Response:
+            if "statins" in request.query.get("term", ""):
+                raise web.HTTPInternalServerError()
+            return await super().esearch(request)
+
+    async def refresh():
+        async with serve_eutils(FailingEutils(latency=0)), aiohttp.ClientSession() as session:
+            return await refresh_all(store, session)
+
+    broken, working = asyncio.run(refresh())
+    assert "error" in broken
+    assert working["checked"] == 200 and "error" not in working
+
+
+def test_new_pmids_beyond_max_results_are_fetched_by_later_refreshes(serve_eutils, tmp_path):
+    store = SavedSearchStore(str(tmp_path / "saved.sqlite3"))
+    search_id = store.add("statins", "statins elderly", max_results=20)
+
+    async def refresh_three_times():
+        summaries = []
+        async with serve_eutils(MockEutils(latency=0, missing_abstract_rate=0, total_count=50)), aiohttp.ClientSession() as session:
+            summaries.append(await refresh_saved_search(store, search_id, session))
+            # A week passes; MockEutils ignores the date window, so all 50 PMIDs count as added since the last run
+            store._conn.execute("UPDATE searches SET last_run_date = '2020/01/01' WHERE id = ?", (search_id,))
+            store._conn.commit()
+            summaries.append(await refresh_saved_search(store, search_id, session))
+            last_run_date = store.get(search_id)["last_run_date"]
+            summaries.append(await refresh_saved_search(store, search_id, session))
+        return summaries, last_run_date
+
+    (first, second, third), held_date = asyncio.run(refresh_three_times())
+    assert [summary["new"] for summary in (first, second, third)] == [20, 20, 10]
+    assert [summary["more"] for summary in (first, second, third)] == [True, True, False]
+    # The capped refresh kept the old date, so the next one's date window still covered the 10 left over
+    assert held_date == "2020/01/01"
+    assert store.get(search_id)["last_run_date"] != "2020/01/01"
+    assert len(store.seen_pmids(search_id)) == 50
@@ -0,0 +1,110 @@
+import asyncio
+
+from aiohttp import web
+
+from mock_servers import MockChatCompletions
+from pubmed_search import search_notices
+from summarize import MAP_MODEL, MODEL_PRICES, REDUCE_MODEL, estimate_tokens, summarize_articles, summary_batches
+
+QUESTION = "Do statins prevent cardiovascular events in the elderly?"
+
+
+def make_articles(count: int, abstract_words: int = 250) -> list:
+    return [
+        {"pmid": str(30000000 + i), "title": f"Statin trial {i}", "year": "2023", "journal": "The Lancet",
+         "link": f"https://pubmed.ncbi.nlm.nih.gov/{30000000 + i}", "abstract": " ".join(["statins reduced events"] * (abstract_words // 3))}
+        for i in range(count)
+    ]
+
+
+async def summarize(articles: list, **kwargs) -> tuple:
+    stats = {}
+    notices = []
+    search_notices.set(notices)
+    answers = [answer async for answer in summarize_articles(QUESTION, articles, stats, **kwargs)]
+    return answers, stats, notices
+
+
+def test_batches_fit_the_prompt_token_budget():
+    articles = make_articles(40)
+    batches = summary_batches(articles, token_budget=2000, max_abstract_tokens=600)
+    assert [article for batch in batches for article in batch] == articles
+    for batch in batches:
+        assert sum(estimate_tokens(a['title']) + min(estimate_tokens(a['abstract']), 600) + 8 for a in batch) <= 2000
+
+
+def test_map_requests_are_batched_and_bounded_in_concurrency(serve_chat):
+    articles = make_articles(40)
+
+    async def run():
+        async with serve_chat(MockChatCompletions(token_delay=0, first_token_delay=0.05)) as chat:
+            answers, stats, _ = await summarize(articles, max_concurrency=3, token_budget=2000)
+        return chat, answers, stats
+
+    chat, answers, stats = asyncio.run(run())
+    assert stats["map_requests"] == len(summary_batches(articles, 2000, 600)) > 3
+    assert chat.counts["max_in_flight"] == 3
+    assert chat.counts["requests"] == stats["map_requests"] + 1  # The map batches, then one streamed reduce
+    # The reduce step streams: the answer grows over several chunks
+    assert len(answers) > 1 and answers[-1].startswith(answers[0])
+
+
+def test_cached_summaries_skip_the_map_step(serve_chat):
+    articles = make_articles(12)
+
+    async def run_twice():
+        async with serve_chat(MockChatCompletions(token_delay=0, first_token_delay=0)):
+            _, cold, _ = await summarize(articles)
+            _, warm, _ = await summarize(articles)
+        return cold, warm
+
+    cold, warm = asyncio.run(run_twice())
+    assert (cold["map_requests"], cold["cached_summaries"]) == (len(summary_batches(articles, 3000, 600)), 0)
+    assert (warm["map_requests"], warm["cached_summaries"]) == (0, 12)
+    assert warm["cost_usd"] < cold["cost_usd"]
+
+
+def test_usage_cost_and_latency_are_reported(serve_chat):
+    articles = make_articles(5)
+
+    async def run():
+        async with serve_chat(MockChatCompletions(token_delay=0, first_token_delay=0)):
+            return await summarize(articles)
+
+    _, stats, _ = asyncio.run(run())
+    assert stats["prompt_tokens"] > 0 and stats["completion_tokens"] > 0
+    map_prices, reduce_prices = MODEL_PRICES[MAP_MODEL], MODEL_PRICES[REDUCE_MODEL]
+    assert min(map_prices[0], reduce_prices[0]) * stats["prompt_tokens"] / 1e6 < stats["cost_usd"]
+    assert stats["cost_usd"] < (reduce_prices[0] * stats["prompt_tokens"] + reduce_prices[1] * stats["completion_tokens"]) / 1e6
+    assert 0 <= stats["map_seconds"] <= stats["first_token_seconds"] <= stats["total_seconds"]
+
+
+class ArrayReplyChat(MockChatCompletions):
+    """MockChatCompletions whose JSON-mode replies are a valid JSON array instead of an object."""
+
+    async def chat(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        if body.get("response_format", {}).get("type") != "json_object":
+            return await super().chat(request)
+        self.counts["requests"] += 1
+        return web.json_response({
+            "id": "mock", "object": "chat.completion", "created": 0, "model": body["model"],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 2, "total_tokens": 12},
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": '["not", "an object"]'}}],
+        })
+
+
+def test_a_reply_that_is_not_a_json_object_falls_back_to_the_abstracts(serve_chat):
+    articles = make_articles(3)
+
+    async def run_twice():
+        async with serve_chat(ArrayReplyChat(token_delay=0, first_token_delay=0)):
+            first = await summarize(articles)
+            _, second, _ = await summarize(articles)
+        return first, second
+
+    (answers, stats, notices), second = asyncio.run(run_twice())
+    assert answers and "total_seconds" in stats
+    assert [level for level, _ in notices] == ["warning"]
+    # Fallbacks are not cached, so the next summary asks again
+    assert second["map_requests"] == 1